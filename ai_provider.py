@@ -1,49 +1,155 @@
-import os, json
-from typing import List, Tuple
-from openai import OpenAI
+import os, json, random, asyncio
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from pathlib import Path
-from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
 from schema import GenerationConfig
 from i18n import build_prompt
+from word_cache import WordProblemCache, cache_key, validate_pairs
+from word_templates import render_word_problems
+from metrics import stage, LLM_CALLS, WORD_CACHE, WORD_FALLBACK
 
-# Nạp .env cùng thư mục backend
-load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env")
-
-def generate_word_problems(cfg: GenerationConfig, n: int) -> List[Tuple[str, str]]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        # Fallback nội bộ: tạo n câu đơn giản + đáp án số
-        import random
-        random.seed(cfg.seed or 42)
-        items: List[Tuple[str, str]] = []
-        for _ in range(n):
-            a = random.randint(cfg.min_value, cfg.max_value)
-            b = random.randint(cfg.min_value, cfg.max_value)
-            op = random.choice(cfg.operations or ["+","-","×","÷"])
-            if op == "+":
-                text, ans = f"Bạn Nam có {a} viên bi, mẹ cho thêm {b} viên. Hỏi Nam có tất cả bao nhiêu viên bi?", str(a+b)
-            elif op == "-":
-                a, b = max(a,b), min(a,b)
-                text, ans = f"Có {a} quả cam, ăn bớt {b} quả. Còn lại bao nhiêu quả cam?", str(a-b)
-            elif op == "×":
-                text, ans = f"Mỗi hộp có {a} cái bút. Có {b} hộp như thế. Hỏi có tất cả bao nhiêu cái bút?", str(a*b)
-            else:  # ÷
-                b = max(1, b)
-                t = a * b
-                text, ans = f"Có {t} cái kẹo chia đều cho {b} bạn. Mỗi bạn được bao nhiêu cái kẹo?", str(a)
-            items.append((text, ans))
-        return items
-    
-    client = OpenAI(api_key=api_key)
-    prompt = build_prompt(cfg, n)
-    resp = client.chat.completions.create(
-        model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-        messages=[{"role": "user", "content": prompt}],
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+# Nạp .env cùng thư mục backend (chỉ import dotenv khi thật sự có file)
+_ENV_FILE = Path(__file__).resolve().parent / ".env"
+if _ENV_FILE.exists():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=_ENV_FILE)
+
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+BUDGET_S = float(os.getenv("OPENAI_BUDGET_S", 8.0))          # tổng thời gian chờ LLM cho 1 request
+CHUNK_SIZE = int(os.getenv("OPENAI_CHUNK_SIZE", 10))           # số câu mỗi lời gọi con
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 8))  # số lời gọi song song toàn tiến trình
+
+_cache = WordProblemCache.from_env()
+
+# Client dùng chung (giữ kết nối keep-alive), tạo lười ở lần gọi đầu.
+# Gói openai (~0.5s import) cũng chỉ được import khi cần, không làm chậm lúc khởi động.
+_async_client: Optional["AsyncOpenAI"] = None
+_sync_client: Optional["OpenAI"] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+def preload() -> None:
+    """Import trước openai/httpx (warm-up), để request đầu tiên không phải chờ."""
+    import httpx  # noqa: F401
+    import openai  # noqa: F401
+
+def _limits() -> "httpx.Limits":
+    import httpx
+    return httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+
+def _get_async_client() -> "AsyncOpenAI":
+    global _async_client, _semaphore
+    if _async_client is None:
+        import httpx
+        from openai import AsyncOpenAI
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=BUDGET_S,
+            max_retries=0,  # ngân sách thời gian do ta quản lý, thiếu thì bù bằng mẫu nội bộ
+            http_client=httpx.AsyncClient(limits=_limits(), timeout=BUDGET_S),
+        )
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _async_client
+
+def _get_sync_client() -> "OpenAI":
+    # chỉ dùng cho luồng nền bổ sung cache (không có event loop)
+    global _sync_client
+    if _sync_client is None:
+        import httpx
+        from openai import OpenAI
+        _sync_client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=4 * BUDGET_S,
+            http_client=httpx.Client(limits=_limits(), timeout=4 * BUDGET_S),
+        )
+    return _sync_client
+
+async def close_clients() -> None:
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+
+def _request_kwargs(cfg: GenerationConfig, n: int) -> dict:
+    return dict(
+        model=MODEL,
+        messages=[{"role": "user", "content": build_prompt(cfg, n)}],
         response_format={"type": "json_object"},
         temperature=0.6,
     )
 
-    content = resp.choices[0].message.content or "{}"
-    data = json.loads(content)
+def _parse_items(content: Optional[str], n: int) -> List[Tuple[str, str]]:
+    data = json.loads(content or "{}")
     items = data.get("items", [])[:n]
     return [(str(it.get("text","")).strip(), str(it.get("answer","")).strip()) for it in items]
+
+def _ask_llm(cfg: GenerationConfig, n: int) -> List[Tuple[str, str]]:
+    LLM_CALLS.inc(outcome="background")
+    resp = _get_sync_client().chat.completions.create(**_request_kwargs(cfg, n))
+    return _parse_items(resp.choices[0].message.content, n)
+
+async def _ask_llm_async(cfg: GenerationConfig, n: int) -> List[Tuple[str, str]]:
+    client = _get_async_client()
+    async with _semaphore:
+        resp = await client.chat.completions.create(**_request_kwargs(cfg, n))
+    return _parse_items(resp.choices[0].message.content, n)
+
+async def _ask_llm_chunked(cfg: GenerationConfig, n: int, budget: float) -> List[Tuple[str, str]]:
+    """Chia n câu thành nhiều lời gọi nhỏ chạy song song; quá ngân sách thì bỏ các lời gọi chưa xong."""
+    sizes = [min(CHUNK_SIZE, n - i) for i in range(0, n, CHUNK_SIZE)]
+    tasks = [asyncio.ensure_future(_ask_llm_async(cfg, k)) for k in sizes]
+    done, pending = await asyncio.wait(tasks, timeout=budget)
+    for t in pending:
+        t.cancel()
+    LLM_CALLS.inc(len(pending), outcome="timeout")
+    out: List[Tuple[str, str]] = []
+    for t in done:
+        if t.exception() is not None:
+            print("OpenAI chunk failed:", t.exception())
+            LLM_CALLS.inc(outcome="error")
+            continue
+        LLM_CALLS.inc(outcome="ok")
+        out.extend(t.result())
+    return validate_pairs(out)
+
+async def generate_word_problems(
+    cfg: GenerationConfig, n: int, budget: Optional[float] = None
+) -> List[Tuple[str, str]]:
+    """
+    Trả về đúng n cặp (đề, đáp án):
+    1) lấy từ cache nếu có
+    2) phần thiếu hỏi OpenAI theo từng khúc song song, trong giới hạn `budget` giây
+    3) vẫn thiếu (quá hạn/lỗi/model trả ít) thì bù bằng mẫu nội bộ
+    """
+    with stage("generate_word_problems"):
+        if not os.getenv("OPENAI_API_KEY"):
+            WORD_FALLBACK.inc(n, reason="no_api_key")
+            return render_word_problems(cfg, n)
+
+        # Ưu tiên pool đã cache theo (lớp, phép tính, phạm vi, ngôn ngữ).
+        # Cache giữ lock và đọc/ghi SQLite (luồng nền bổ sung cũng dùng chung lock)
+        # nên mọi lời gọi tới nó chạy trong threadpool, không chặn event loop.
+        key = cache_key(cfg)
+        items = await run_in_threadpool(_cache.take, key, n, random.Random(cfg.seed))
+        WORD_CACHE.inc(len(items), result="hit")
+        WORD_CACHE.inc(n - len(items), result="miss")
+        if len(items) < n:
+            with stage("llm"):
+                fresh = await _ask_llm_chunked(cfg, n - len(items), BUDGET_S if budget is None else budget)
+            await run_in_threadpool(_cache.add, key, fresh)
+            have = {t for t, _ in items}
+            items += [p for p in fresh if p[0] not in have][: n - len(items)]
+        await run_in_threadpool(_cache.maybe_topup, key, lambda k: _ask_llm(cfg, k))
+
+        missing = n - len(items)
+        if missing > 0:
+            print(f"OpenAI returned {n - missing}/{n} word problems, filling {missing} locally")
+            WORD_FALLBACK.inc(missing, reason="shortfall")
+            items += render_word_problems(cfg, missing)
+        return items
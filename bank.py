@@ -0,0 +1,162 @@
+# backend/bank.py
+"""
+Ngân hàng câu hỏi lưu trên SQLite cục bộ.
+
+Câu hỏi upload/sinh ra được lưu một lần (đã chấm điểm, đã xác định phép
+tính), sau đó /api/assemble/bank chỉ cần bank_id + bộ lọc: ứng viên được
+lấy bằng truy vấn có index thay vì gửi lại cả pool trong mỗi request.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from schema import ProblemLike, ProblemRecord, Mode
+from generator import BUCKET_BOUNDS, score_batch
+
+_DEFAULT_PATH = Path(__file__).resolve().parent / "data" / "problem_bank.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bank_id TEXT NOT NULL REFERENCES banks(id) ON DELETE CASCADE,
+    text TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    distractors TEXT NOT NULL DEFAULT '[]',
+    kind TEXT NOT NULL,
+    operation TEXT,
+    difficulty REAL NOT NULL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_problems_kind ON problems(bank_id, kind, difficulty);
+CREATE INDEX IF NOT EXISTS ix_problems_op ON problems(bank_id, kind, operation, difficulty);
+CREATE INDEX IF NOT EXISTS ix_problems_source ON problems(bank_id, kind, source, difficulty);
+"""
+
+
+class ProblemBank:
+    def __init__(self, path: Optional[Path] = None):
+        target = ":memory:"
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            target = str(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(target, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "ProblemBank":
+        raw_path = os.getenv("PROBLEM_BANK_PATH", str(_DEFAULT_PATH))
+        return cls(Path(raw_path) if raw_path else None)  # PROBLEM_BANK_PATH="" -> chỉ dùng RAM
+
+    def create(self, name: Optional[str] = None) -> str:
+        bank_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO banks(id, name, created) VALUES (?, ?, ?)", (bank_id, name, time.time())
+            )
+        return bank_id
+
+    def exists(self, bank_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM banks WHERE id = ?", (bank_id,)).fetchone()
+        return row is not None
+
+    def add(self, bank_id: str, problems: Iterable[ProblemLike]) -> int:
+        problems = list(problems)
+        scored = score_batch(problems)
+        rows = [
+            (
+                bank_id, p.text, p.answer, json.dumps(p.distractors, ensure_ascii=False), p.kind,
+                op, p.difficulty if p.difficulty else d, p.source,
+            )
+            for p, op, d in zip(problems, scored.operation, scored.difficulty.tolist())
+        ]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO problems(bank_id, text, answer, distractors, kind, operation, difficulty, source)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.execute("COMMIT")
+        return len(rows)
+
+    def info(self, bank_id: str) -> Dict[str, object]:
+        with self._lock:
+            name, created = self._db.execute(
+                "SELECT name, created FROM banks WHERE id = ?", (bank_id,)
+            ).fetchone()
+            by_kind = dict(self._db.execute(
+                "SELECT kind, COUNT(*) FROM problems WHERE bank_id = ? GROUP BY kind", (bank_id,)
+            ).fetchall())
+        return {
+            "bank_id": bank_id,
+            "name": name,
+            "created": created,
+            "count": sum(by_kind.values()),
+            "by_kind": by_kind,
+        }
+
+    def candidates(
+        self,
+        bank_id: str,
+        kind: str,
+        k: int,
+        mode: Mode,
+        operations: Optional[List[str]] = None,
+        sources: Optional[List[str]] = None,
+    ) -> List[ProblemRecord]:
+        """
+        Lấy đủ ứng viên để assemble_exam chọn ra k câu thuộc `kind`:
+        - easy_to_hard / hard_to_easy: k câu dễ nhất / khó nhất
+        - balanced: tối đa k câu dễ nhất trong mỗi bucket độ khó
+        Bộ lọc `operations` chỉ áp cho câu số học: câu lời văn thường không có
+        ký hiệu phép tính trong đề nên cột operation của chúng để trống.
+        """
+        if k <= 0:
+            return []
+        where = ["bank_id = ?", "kind = ?"]
+        args: List[object] = [bank_id, kind]
+        if operations and kind == "arithmetic":
+            where.append(f"operation IN ({','.join('?' * len(operations))})")
+            args += operations
+        if sources:
+            where.append(f"source IN ({','.join('?' * len(sources))})")
+            args += sources
+
+        cols = "SELECT id, text, answer, distractors, kind, difficulty, source FROM problems"
+        if mode == "balanced":
+            lo, hi = BUCKET_BOUNDS
+            queries = [
+                (" AND difficulty < ?", [lo]),
+                (" AND difficulty >= ? AND difficulty < ?", [lo, hi]),
+                (" AND difficulty >= ?", [hi]),
+            ]
+            order = "difficulty, id"
+        else:
+            queries = [("", [])]
+            order = "difficulty DESC, id" if mode == "hard_to_easy" else "difficulty, id"
+
+        rows = []
+        with self._lock:
+            for extra, extra_args in queries:
+                sql = f"{cols} WHERE {' AND '.join(where)}{extra} ORDER BY {order} LIMIT ?"
+                rows += self._db.execute(sql, args + extra_args + [k]).fetchall()
+
+        rows.sort(key=lambda r: r[0])  # thứ tự thêm vào bank = thứ tự trong pool
+        return [
+            ProblemRecord(rid, text, answer, json.loads(dis), kd, diff, src)
+            for rid, text, answer, dis, kd, diff, src in rows
+        ]
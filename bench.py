@@ -0,0 +1,360 @@
+# bench.py
+"""
+Benchmark các đường nóng: sinh đề, distractor, chấm điểm, đánh giá, ghép đề,
+parse upload, render PDF và các endpoint FastAPI (qua TestClient).
+
+- Không gọi OpenAI: generate_word_problems được thay bằng stub sinh câu nội bộ.
+- Mỗi case chạy với nhiều kích thước đầu vào (mặc định 10 -> 100k câu).
+- Kết quả ghi ra JSON để so sánh giữa các lần chạy; có --baseline thì so
+  median từng case, chậm hơn quá --threshold lần thì báo hồi quy (exit 1).
+
+Ví dụ:
+    python bench.py --out bench_results.json
+    python bench.py --quick --baseline bench_results.json --threshold 1.3
+"""
+import os
+
+# Chạy độc lập, không đụng dữ liệu thật: bank/cache chỉ trong RAM,
+# PDF render ngay trong tiến trình (đo chi phí render, không đo IPC)
+os.environ.setdefault("PROBLEM_BANK_PATH", "")
+os.environ.setdefault("WORD_CACHE_PATH", "")
+os.environ.setdefault("PDF_WORKERS", "0")
+os.environ.pop("OPENAI_API_KEY", None)
+
+import argparse
+import dataclasses
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from schema import GenerationConfig, StreamGenerationConfig, ProblemRecord
+from generator import (
+    OPS,
+    make_rng,
+    generate_arithmetic,
+    iter_arithmetic,
+    make_distractors,
+    score_problem,
+    evaluate_exam,
+    assemble_exam,
+)
+from upload import parse_text, parse_upload
+from word_templates import render_word_problems
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000)
+QUICK_SIZES = (10, 100, 1_000)
+DEFAULT_THRESHOLD = 1.3      # chậm hơn baseline 30% -> hồi quy
+DEFAULT_MIN_DELTA_MS = 2.0   # chênh lệch nhỏ hơn mức này coi là nhiễu
+
+
+# -----------------
+# Stub OpenAI
+# -----------------
+async def _stub_word_problems(
+    cfg: GenerationConfig, n: int, budget: Optional[float] = None
+) -> List[Tuple[str, str]]:
+    return render_word_problems(cfg, n)
+
+
+# -----------------
+# Dữ liệu mẫu
+# -----------------
+def _cfg(n: int, **extra) -> StreamGenerationConfig:
+    return StreamGenerationConfig(
+        grade=3, operations=list(OPS), count=n, min_value=1, max_value=100, seed=1, **extra
+    )
+
+
+def make_pool(n: int) -> List[ProblemRecord]:
+    """n câu: ~2/3 số học, ~1/3 lời văn, đã chấm điểm như khi sinh thật."""
+    n_word = n // 3
+    pool = [p for batch in iter_arithmetic(_cfg(n - n_word)) for p in batch]
+    pairs = render_word_problems(_cfg(max(1, n_word)), n_word)
+    pool += [
+        ProblemRecord(i, q, a, [], "word", score_problem(ProblemRecord(0, q, "", kind="word")), "generated")
+        for i, (q, a) in enumerate(pairs, start=len(pool) + 1)
+    ]
+    return pool
+
+
+def make_upload_text(n: int) -> str:
+    rng = make_rng(2)
+    a = rng.integers(1, 100, n).tolist()
+    b = rng.integers(1, 100, n).tolist()
+    lines = []
+    for i, (x, y) in enumerate(zip(a, b)):
+        if i % 4 == 3:
+            lines.append(f"Lan có {x} cái kẹo, được cho thêm {y} cái. Hỏi Lan có bao nhiêu cái kẹo? đáp án: {x + y}")
+        elif i % 2:
+            lines.append(f"{x} × {y}, {x * y}")
+        else:
+            lines.append(f"{x} + {y} | {x + y}")
+    return "\n".join(lines) + "\n"
+
+
+def _dump(problems: List[ProblemRecord]) -> List[dict]:
+    return [dataclasses.asdict(p) for p in problems]
+
+
+# -----------------
+# Các case
+# -----------------
+class Case(NamedTuple):
+    group: str
+    name: str
+    max_size: int
+    # size -> hàm không tham số cần đo (dữ liệu đầu vào dựng trước, không tính giờ)
+    setup: Callable[[int], Callable[[], object]]
+
+
+def _core_cases() -> List[Case]:
+    def gen(n):
+        cfg = _cfg(n)
+        return lambda: generate_arithmetic(cfg)
+
+    def distractors(n):
+        answers = [str(x) for x in make_rng(3).integers(0, 10_000, n).tolist()]
+        rng = make_rng(4)
+        return lambda: [make_distractors(a, rng) for a in answers]
+
+    def score(n):
+        pool = make_pool(n)
+        return lambda: [score_problem(p) for p in pool]
+
+    def evaluate(n):
+        pool = make_pool(n)
+        return lambda: evaluate_exam(pool)
+
+    def assemble(mode):
+        def setup(n):
+            pool = make_pool(n)
+            k = max(1, n // 10)
+            return lambda: assemble_exam(pool, 2 * k, k, k, mode)
+        return setup
+
+    def words(lang):
+        def setup(n):
+            cfg = _cfg(n, language=lang)
+            return lambda: render_word_problems(cfg, n)
+        return setup
+
+    def upload_text(n):
+        data = make_upload_text(n)
+        return lambda: parse_text(data)
+
+    def upload_stream(n):
+        raw = make_upload_text(n).encode()
+        return lambda: parse_upload(io.BytesIO(raw))
+
+    def render(n):
+        from pdf import render_pdf
+        pool = make_pool(n)
+        return lambda: render_pdf(io.BytesIO(), "BENCH", pool, with_answers=True)
+
+    return [
+        Case("core", "generate_arithmetic", 100_000, gen),
+        Case("core", "make_distractors", 100_000, distractors),
+        Case("core", "word_templates.vi", 100_000, words("vi")),
+        Case("core", "word_templates.en", 100_000, words("en")),
+        Case("core", "score_problem", 100_000, score),
+        Case("core", "evaluate_exam", 100_000, evaluate),
+        Case("core", "assemble_exam.easy_to_hard", 100_000, assemble("easy_to_hard")),
+        Case("core", "assemble_exam.balanced", 100_000, assemble("balanced")),
+        Case("core", "assemble_exam.hard_to_easy", 100_000, assemble("hard_to_easy")),
+        Case("core", "upload.parse_text", 100_000, upload_text),
+        Case("core", "upload.parse_upload", 100_000, upload_stream),
+        Case("core", "render_pdf", 10_000, render),
+    ]
+
+
+def _api_cases() -> List[Case]:
+    from fastapi.testclient import TestClient
+    import main
+    from response_cache import ResponseCache
+
+    main.generate_word_problems = _stub_word_problems
+    # cấu hình bench có seed và không gọi LLM nên mặc định sẽ được cache: tắt cache
+    # để các case đo đúng đường sinh/render; đường cache được đo riêng (case "cached")
+    main.response_cache = ResponseCache(max_bytes=0, max_entry_bytes=0)
+    client = TestClient(main.app)
+
+    def post(url: str, **kw) -> Callable[[], object]:
+        def call():
+            r = client.post(url, **kw)
+            if r.status_code != 200:
+                raise RuntimeError(f"{url} -> {r.status_code}: {r.text[:200]}")
+            return r.content
+        return call
+
+    def cfg_json(n, **extra):
+        return _cfg(n, include_word_problems=True, **extra).model_dump()
+
+    def cached(url: str):
+        def setup(n):
+            cache = ResponseCache()
+            call = post(url, json=cfg_json(n))
+
+            def hit():
+                prev, main.response_cache = main.response_cache, cache
+                try:
+                    return call()
+                finally:
+                    main.response_cache = prev
+
+            hit()  # lần đầu ghi vào cache, các lần đo sau đều là hit_memory
+            return hit
+        return setup
+
+    def assemble(n):
+        pool = _dump(make_pool(n))
+        k = max(1, n // 10)
+        return post("/api/assemble", json=dict(pool=pool, total_count=2 * k, mcq_count=k, word_count=k, mode="balanced"))
+
+    return [
+        Case("api", "POST /api/generate", 200, lambda n: post("/api/generate", json=cfg_json(n))),
+        Case("api", "POST /api/generate/stream", 100_000, lambda n: post("/api/generate/stream", json=cfg_json(n))),
+        Case("api", "POST /api/score", 10_000, lambda n: post("/api/score", json=_dump(make_pool(n)))),
+        Case("api", "POST /api/evaluate", 10_000, lambda n: post("/api/evaluate", json=_dump(make_pool(n)))),
+        Case("api", "POST /api/assemble", 10_000, assemble),
+        Case("api", "POST /api/upload", 100_000, lambda n: post(
+            "/api/upload", files={"file": ("bench.txt", make_upload_text(n).encode(), "text/plain")}
+        )),
+        Case("api", "POST /api/export/bundle", 200, lambda n: post("/api/export/bundle", json=cfg_json(n))),
+        Case("api", "POST /api/generate (cached)", 200, cached("/api/generate")),
+        Case("api", "POST /api/export/bundle (cached)", 200, cached("/api/export/bundle")),
+    ]
+
+
+# -----------------
+# Đo & so sánh
+# -----------------
+def measure(fn: Callable[[], object], repeat: int, budget: float, warmup: bool) -> List[float]:
+    """Chạy tối đa `repeat` lần (ít nhất 1), dừng sớm khi tổng thời gian vượt `budget` giây."""
+    if warmup:
+        fn()
+    times: List[float] = []
+    spent = 0.0
+    while len(times) < repeat and (not times or spent < budget):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        times.append(dt)
+        spent += dt
+    return times
+
+
+def run_cases(
+    cases: List[Case], sizes: List[int], repeat: int, budget: float, only: Optional[str]
+) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    for case in cases:
+        if only and only not in f"{case.group}.{case.name}":
+            continue
+        for n in sizes:
+            if n > case.max_size:
+                continue
+            key = f"{case.group}.{case.name}[{n}]"
+            fn = case.setup(n)
+            times = measure(fn, repeat, budget, warmup=n <= 1_000)
+            med = statistics.median(times)
+            results[key] = {
+                "group": case.group,
+                "name": case.name,
+                "size": n,
+                "runs": len(times),
+                "min_ms": round(min(times) * 1e3, 4),
+                "median_ms": round(med * 1e3, 4),
+                "per_item_us": round(med * 1e6 / n, 4),
+            }
+            print(f"{key:<48} {med * 1e3:>11.3f} ms  ({len(times)} runs, {med * 1e6 / n:.2f} µs/câu)")
+    return results
+
+
+def compare(
+    current: Dict[str, dict], baseline: Dict[str, dict], threshold: float, min_delta_ms: float
+) -> List[str]:
+    """Danh sách case bị hồi quy: median > baseline * threshold và chênh quá min_delta_ms."""
+    regressions = []
+    for key, cur in current.items():
+        base = baseline.get(key)
+        if not base or base["median_ms"] <= 0:
+            continue
+        ratio = cur["median_ms"] / base["median_ms"]
+        cur["baseline_median_ms"] = base["median_ms"]
+        cur["ratio"] = round(ratio, 3)
+        if ratio > threshold and cur["median_ms"] - base["median_ms"] > min_delta_ms:
+            regressions.append(
+                f"{key}: {base['median_ms']:.3f} ms -> {cur['median_ms']:.3f} ms (x{ratio:.2f})"
+            )
+    return regressions
+
+
+def _meta() -> dict:
+    import pydantic
+    return {
+        "created": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pydantic": pydantic.__version__,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=list(DEFAULT_SIZES),
+                    help="kích thước đầu vào, phân tách bằng dấu phẩy")
+    ap.add_argument("--quick", action="store_true", help=f"chỉ chạy các cỡ {QUICK_SIZES}")
+    ap.add_argument("--max-size", type=int, default=None, help="bỏ các cỡ lớn hơn giá trị này")
+    ap.add_argument("--repeat", type=int, default=5, help="số lần đo tối đa mỗi case")
+    ap.add_argument("--budget", type=float, default=2.0, help="giây tối đa cho mỗi case (ít nhất 1 lần đo)")
+    ap.add_argument("--only", default=None, help="chỉ chạy case có tên chứa chuỗi này (vd. core.score)")
+    ap.add_argument("--no-api", action="store_true", help="bỏ qua các case gọi endpoint")
+    ap.add_argument("--out", default="bench_results.json", help="file JSON ghi kết quả")
+    ap.add_argument("--baseline", default=None, help="file JSON của lần chạy trước để so sánh")
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                    help="tỉ lệ median/baseline tối đa trước khi coi là hồi quy")
+    ap.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS,
+                    help="bỏ qua chênh lệch tuyệt đối nhỏ hơn mức này (nhiễu)")
+    args = ap.parse_args(argv)
+
+    sizes = list(QUICK_SIZES) if args.quick else sorted(args.sizes)
+    if args.max_size is not None:
+        sizes = [n for n in sizes if n <= args.max_size]
+
+    cases = _core_cases() + ([] if args.no_api else _api_cases())
+    results = run_cases(cases, sizes, args.repeat, args.budget, args.only)
+
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+
+    report = {
+        "meta": {**_meta(), "sizes": sizes, "repeat": args.repeat, "threshold": args.threshold},
+        "results": results,
+        "regressions": regressions,
+    }
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    print(f"\nĐã ghi {len(results)} kết quả vào {args.out}")
+
+    if regressions:
+        print(f"\n{len(regressions)} case chậm hơn baseline quá x{args.threshold}:")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# backend/exam_sessions.py
+"""
+Phiên đánh giá đề tăng dần cho /api/evaluate/sessions.
+
+Frontend mở một phiên với đề hiện tại, sau đó mỗi lần sửa chỉ gửi một câu
+(thêm/sửa/xoá); phiên giữ ExamTally nên mỗi thao tác là O(1) thay vì chấm lại
+cả đề. Phiên nằm trong bộ nhớ của tiến trình: hết hạn sau EVAL_SESSION_TTL
+giây không dùng, tối đa EVAL_SESSION_MAX phiên (đẩy phiên cũ nhất ra trước).
+Chạy nhiều worker uvicorn thì cần sticky session.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from schema import Evaluation, ProblemLike
+from generator import ExamTally
+
+EVAL_SESSION_TTL = float(os.getenv("EVAL_SESSION_TTL", 3600))
+EVAL_SESSION_MAX = int(os.getenv("EVAL_SESSION_MAX", 1000))
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class DuplicateProblemId(ValueError):
+    pass
+
+
+class ExamSessions:
+    def __init__(self, ttl: float = EVAL_SESSION_TTL, max_sessions: int = EVAL_SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Tuple[float, ExamTally]]" = OrderedDict()  # id -> (lần dùng cuối, tally)
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            sid, (used, _) = next(iter(self._sessions.items()))
+            if now - used <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[sid]
+
+    def _touch(self, session_id: str) -> ExamTally:
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            raise SessionNotFound(session_id)
+        self._sessions[session_id] = (now, entry[1])
+        self._sessions.move_to_end(session_id)
+        return entry[1]
+
+    def create(self, problems: Iterable[ProblemLike] = ()) -> Tuple[str, int, Evaluation]:
+        """Mở phiên với đề ban đầu; id trùng thì báo lỗi (không âm thầm ghi đè câu trước)."""
+        problems = list(problems)
+        dup = sorted(pid for pid, c in Counter(p.id for p in problems).items() if c > 1)
+        if dup:
+            raise DuplicateProblemId(f"Trùng id câu hỏi: {', '.join(map(str, dup[:10]))}")
+        tally = ExamTally(problems)
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), tally)
+            self._expire(time.monotonic())
+            return session_id, len(tally), tally.evaluation()
+
+    def evaluation(self, session_id: str) -> Tuple[int, Evaluation]:
+        with self._lock:
+            tally = self._touch(session_id)
+            return len(tally), tally.evaluation()
+
+    def put(self, session_id: str, problem: ProblemLike) -> Tuple[int, Evaluation]:
+        """Thêm hoặc thay câu cùng id, trả về đánh giá mới."""
+        with self._lock:
+            tally = self._touch(session_id)
+            tally.put(problem)
+            return len(tally), tally.evaluation()
+
+    def remove(self, session_id: str, problem_id: int) -> Optional[Tuple[int, Evaluation]]:
+        """Xoá một câu; None nếu phiên không có câu này."""
+        with self._lock:
+            tally = self._touch(session_id)
+            if not tally.remove(problem_id):
+                return None
+            return len(tally), tally.evaluation()
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
@@ -1,71 +1,528 @@
-import random
 import re
-from typing import List
+import heapq
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 from collections import Counter
+from fractions import Fraction
+from itertools import chain, zip_longest
 from statistics import mean
 
-from schema import GenerationConfig, Problem, Operation, Evaluation, Mode
+import numpy as np
+
+from schema import GenerationConfig, ProblemRecord, ProblemLike, Operation, Evaluation, Mode
+from metrics import stage
+
+OPS: Tuple[Operation, ...] = ("+", "-", "×", "÷")
+ADD, SUB, MUL, DIV = range(4)
+_BASE = np.array([0.25, 0.35, 0.6, 0.75])          # hệ số gốc theo thứ tự OPS
+_DISTRACTOR_OFFSETS = np.array([1, -1, 2, -2, -3])  # khớp make_distractors khi đáp án >= 3
+
+# RNG dự phòng cho các lời gọi không truyền rng (Generator có khoá nội bộ nên an toàn đa luồng)
+_fallback_rng = np.random.default_rng()
+
+
+def make_rng(seed: Optional[int] = None) -> np.random.Generator:
+    """RNG riêng cho từng request – không đụng tới `random` toàn cục."""
+    return np.random.default_rng(seed)
+
+
+def derive_seeds(base_seed: Optional[int], n: int) -> List[int]:
+    """n seed độc lập (SeedSequence.spawn) suy ra từ một seed gốc, dùng cho các biến thể đề."""
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(base_seed).spawn(n)]
 
 # -----------------
 # Sinh toán số học
 # -----------------
-def generate_arithmetic(cfg: GenerationConfig) -> List[Problem]:
-    if cfg.seed is not None:
-        random.seed(cfg.seed)
-
-    problems: List[Problem] = []
-    ops: List[Operation] = list(cfg.operations)
-
-    def pick_add() -> Problem:
-        a = random.randint(cfg.min_value, cfg.max_value)
-        b = random.randint(cfg.min_value, cfg.max_value)
-        ans = a + b
-        return Problem(id=0, text=f"{a} + {b} = ?", answer=str(ans), kind="arithmetic", source="generated")
-
-    def pick_sub() -> Problem:
-        a = random.randint(cfg.min_value, cfg.max_value)
-        b = random.randint(cfg.min_value, cfg.max_value)
-        if a < b:
-            a, b = b, a
-        ans = a - b
-        return Problem(id=0, text=f"{a} - {b} = ?", answer=str(ans), kind="arithmetic", source="generated")
-
-    def pick_mul() -> Problem:
-        limit = 12 if cfg.grade <= 3 else cfg.max_value
-        a = random.randint(cfg.min_value, min(limit, cfg.max_value))
-        b = random.randint(cfg.min_value, min(limit, cfg.max_value))
-        ans = a * b
-        return Problem(id=0, text=f"{a} × {b} = ?", answer=str(ans), kind="arithmetic", source="generated")
-
-    def pick_div() -> Problem:
-        limit = max(1, min(12 if cfg.grade <= 3 else cfg.max_value, cfg.max_value))
-        b = random.randint(max(1, cfg.min_value), max(1, limit))
-        q = random.randint(cfg.min_value, max(cfg.min_value + 1, cfg.max_value))
-        a = b * q
-        return Problem(id=0, text=f"{a} ÷ {b} = ?", answer=str(q), kind="arithmetic", source="generated")
-
-    pickers = {"+": pick_add, "-": pick_sub, "×": pick_mul, "÷": pick_div}
-
-    for _ in range(cfg.count):
-        op = random.choice(ops)
-        p = pickers[op]()
-        p.difficulty = score_arithmetic(p.text)  # chấm sơ bộ
-        if cfg.include_distractors:
-            p.distractors = make_distractors(p.answer)
-        problems.append(p)
-
-    for i, p in enumerate(problems, start=1):
-        p.id = i
-    return problems
+def _randint(rng: np.random.Generator, lo: int, hi: int, n: int) -> np.ndarray:
+    # đoạn đóng [lo, hi]; nếu cấu hình khiến hi < lo thì co về lo thay vì lỗi
+    return rng.integers(lo, max(lo, hi) + 1, size=n, dtype=np.int64)
+
+
+def _limits(cfg: GenerationConfig) -> Tuple[int, int, int]:
+    lo, hi = cfg.min_value, cfg.max_value
+    small = min(12 if cfg.grade <= 3 else hi, hi)  # lớp <= 3: nhân/chia trong bảng 12
+    return lo, hi, small
+
+
+def _draw_op(
+    rng: np.random.Generator, cfg: GenerationConfig, op: int, cnt: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    lo, hi, small = _limits(cfg)
+    if op == ADD:
+        x, y = _randint(rng, lo, hi, cnt), _randint(rng, lo, hi, cnt)
+        return x, y, x + y
+    if op == SUB:
+        x, y = _randint(rng, lo, hi, cnt), _randint(rng, lo, hi, cnt)
+        x, y = np.maximum(x, y), np.minimum(x, y)
+        return x, y, x - y
+    if op == MUL:
+        x, y = _randint(rng, lo, small, cnt), _randint(rng, lo, small, cnt)
+        return x, y, x * y
+    d = _randint(rng, max(1, lo), max(1, small), cnt)
+    q = _randint(rng, lo, max(lo + 1, hi), cnt)
+    return d * q, d, q
+
+
+def draw_operands(
+    rng: np.random.Generator, cfg: GenerationConfig, n: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Rút toàn bộ toán hạng cho n câu trong một lượt.
+    Trả về (op_idx, a, b, ans): op_idx là chỉ số trong OPS, a/b là số hiển thị.
+    Ràng buộc giữ nguyên như các picker cũ:
+    - trừ: a >= b (không ra số âm)
+    - nhân/chia: lớp <= 3 giới hạn thừa số/số chia tới 12
+    - chia: luôn chia hết (a = b * q)
+    """
+    ops = np.array([OPS.index(o) for o in (cfg.operations or OPS)], dtype=np.int64)
+    op_idx = ops[rng.integers(0, len(ops), size=n)]
+    a = np.zeros(n, dtype=np.int64)
+    b = np.zeros(n, dtype=np.int64)
+    ans = np.zeros(n, dtype=np.int64)
+
+    for k in np.unique(op_idx).tolist():
+        mask = op_idx == k
+        a[mask], b[mask], ans[mask] = _draw_op(rng, cfg, k, int(mask.sum()))
+
+    return op_idx, a, b, ans
+
+
+# -----------------
+# Sinh không trùng lặp
+# -----------------
+class ProblemSpaceExhausted(ValueError):
+    pass
+
+
+_INDEX_LIMIT = 2**62  # không gian lớn hơn thì không đánh chỉ số được bằng int64
+
+
+def _tri(m: int) -> int:
+    return m * (m + 1) // 2 if m > 0 else 0
+
+
+def op_space_sizes(cfg: GenerationConfig) -> Dict[int, int]:
+    """
+    Số bài khác nhau của từng phép với cấu hình hiện tại (cùng ràng buộc như _draw_op):
+    - cộng/nhân: cặp không thứ tự (3 + 4 ≡ 4 + 3)
+    - trừ: cặp a >= b
+    - chia: mọi cặp (số chia, thương)
+    """
+    lo, hi, small = _limits(cfg)
+    m = max(lo, hi) - lo + 1
+    ms = max(lo, small) - lo + 1
+    dlo = max(1, lo)
+    divisors = max(dlo, max(1, small)) - dlo + 1
+    quotients = max(lo + 1, hi) - lo + 1
+    return {ADD: _tri(m), SUB: _tri(m), MUL: _tri(ms), DIV: divisors * quotients}
+
+
+def problem_space_size(cfg: GenerationConfig) -> int:
+    sizes = op_space_sizes(cfg)
+    return sum(sizes[k] for k in {OPS.index(o) for o in (cfg.operations or OPS)})
+
+
+def _allocate(
+    rng: np.random.Generator, n: int, weights: Dict[int, int], caps: Dict[int, int]
+) -> Dict[int, int]:
+    """Chia n câu cho các phép theo trọng số (như chọn phép ngẫu nhiên), không vượt sức chứa."""
+    counts = dict.fromkeys(weights, 0)
+    left = n
+    while left > 0:  # mỗi vòng hoặc xếp hết, hoặc có thêm ít nhất một phép bị lấp đầy
+        open_ops = [k for k in weights if counts[k] < caps[k]]
+        w = np.array([weights[k] for k in open_ops], dtype=float)
+        for k, d in zip(open_ops, rng.multinomial(left, w / w.sum()).tolist()):
+            take = min(d, caps[k] - counts[k])
+            counts[k] += take
+            left -= take
+    return counts
+
+
+def _tri_decode(t: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Chỉ số t -> cặp (x, y) với 0 <= x <= y, theo thứ tự (0,0), (0,1), (1,1), (0,2), ..."""
+    y = np.floor((np.sqrt(8.0 * t + 1) - 1) / 2).astype(np.int64)
+    y += ((y + 1) * (y + 2) // 2 <= t).astype(np.int64)  # sửa sai số làm tròn của sqrt
+    y -= (y * (y + 1) // 2 > t).astype(np.int64)
+    return t - y * (y + 1) // 2, y
+
+
+def _decode(
+    rng: np.random.Generator, cfg: GenerationConfig, op: int, t: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    lo, hi, small = _limits(cfg)
+    if op == DIV:
+        quotients = max(lo + 1, hi) - lo + 1
+        d = max(1, lo) + t // quotients
+        q = lo + t % quotients
+        return d * q, d, q
+    x, y = _tri_decode(t)
+    x, y = lo + x, lo + y
+    if op == SUB:
+        return y, x, y - x
+    # cộng/nhân: một cặp không thứ tự, hiển thị theo chiều ngẫu nhiên
+    swap = rng.random(len(t)) < 0.5
+    x, y = np.where(swap, y, x), np.where(swap, x, y)
+    return x, y, (x + y if op == ADD else x * y)
+
+
+def _draw_op_sparse(
+    rng: np.random.Generator, cfg: GenerationConfig, op: int, cnt: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # không gian quá lớn để đánh chỉ số: rút thường rồi bỏ trùng (gần như không bao giờ trùng)
+    seen: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+    while len(seen) < cnt:
+        for x, y, z in zip(*(v.tolist() for v in _draw_op(rng, cfg, op, cnt - len(seen)))):
+            key = (min(x, y), max(x, y)) if op in (ADD, MUL) else (x, y)
+            seen.setdefault(key, (x, y, z))
+    cols = np.array(list(seen.values()), dtype=np.int64).reshape(-1, 3)
+    return cols[:, 0], cols[:, 1], cols[:, 2]
+
+
+def draw_unique_operands(
+    rng: np.random.Generator, cfg: GenerationConfig, n: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Như draw_operands nhưng n bài đôi một khác nhau, không dùng vòng lặp thử lại:
+    mỗi phép rút k chỉ số phân biệt trong không gian bài của nó (Generator.choice
+    không hoàn lại) rồi giải mã chỉ số -> toán hạng. Chi phí như nhau dù không
+    gian còn thưa hay gần cạn; n lớn hơn không gian thì báo lỗi ngay.
+    """
+    ops = [OPS.index(o) for o in (cfg.operations or OPS)]
+    weights = dict(Counter(ops))
+    caps = {k: s for k, s in op_space_sizes(cfg).items() if k in weights}
+    total = sum(caps.values())
+    if n > total:
+        raise ProblemSpaceExhausted(
+            f"Chỉ có {total} bài khác nhau với cấu hình này, không đủ {n} câu không trùng"
+        )
+
+    parts = []
+    for k, cnt in _allocate(rng, n, weights, caps).items():
+        if cnt == 0:
+            continue
+        if caps[k] < _INDEX_LIMIT:
+            t = rng.choice(caps[k], size=cnt, replace=False).astype(np.int64)
+            a, b, ans = _decode(rng, cfg, k, t)
+        else:
+            a, b, ans = _draw_op_sparse(rng, cfg, k, cnt)
+        parts.append((np.full(cnt, k, dtype=np.int64), a, b, ans))
+
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    order = rng.permutation(n)  # trộn thứ tự các phép như khi chọn ngẫu nhiên từng câu
+    op_idx, a, b, ans = (np.concatenate(col)[order] for col in zip(*parts))
+    return op_idx, a, b, ans
+
+
+# -----------------
+# Sinh theo độ khó mục tiêu
+# -----------------
+class DifficultyUnreachable(ValueError):
+    pass
+
+
+_Interval = Tuple[float, float, bool]  # (độ khó min, max, max có được lấy không)
+_Sampler = Callable[[np.random.Generator, int], Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+
+def _score_at(op: int, s: int) -> float:
+    # score_arithmetic_batch viết theo tổng toán hạng s = |a| + |b|
+    return min(1.0, max(0.0, float(_BASE[op]) + 0.5 * min(1.0, s / 200.0)))
+
+
+def _first_sum(op: int, pred: Callable[[float], bool]) -> Optional[int]:
+    """Tổng nhỏ nhất s >= 0 có pred(điểm) đúng; điểm tăng theo s và bão hoà từ s = 200."""
+    if not pred(_score_at(op, 200)):
+        return None
+    lo, hi = 0, 200
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if pred(_score_at(op, mid)):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def _sum_bounds(op: int, interval: _Interval) -> Optional[Tuple[int, Optional[int]]]:
+    """Nghịch đảo công thức chấm: khoảng tổng [s1, s2] (s2=None: không chặn trên) cho độ khó trong interval."""
+    d_lo, d_hi, inclusive = interval
+    s1 = _first_sum(op, lambda v: v >= d_lo)
+    if s1 is None:
+        return None
+    nxt = _first_sum(op, (lambda v: v > d_hi) if inclusive else (lambda v: v >= d_hi))
+    s2 = None if nxt is None else nxt - 1
+    if s2 is not None and s2 < s1:
+        return None
+    return s1, s2
+
+
+def _pair_sampler(lo: int, hi: int, s1: int, s2: Optional[int]) -> Optional[_Sampler]:
+    # x, y trong [lo, hi] với x + y trong [s1, s2]: rút tổng trước rồi rút x trong phần hợp lệ
+    hi = max(lo, hi)
+    s1, s2 = max(s1, 2 * lo), 2 * hi if s2 is None else min(s2, 2 * hi)
+    if s1 > s2:
+        return None
+
+    def sample(rng: np.random.Generator, cnt: int):
+        s = rng.integers(s1, s2 + 1, size=cnt, dtype=np.int64)
+        x = rng.integers(np.maximum(lo, s - hi), np.minimum(hi, s - lo) + 1, dtype=np.int64)
+        return x, s - x
+    return sample
+
+
+def _div_sampler(cfg: GenerationConfig, s1: int, s2: Optional[int]) -> Optional[_Sampler]:
+    # số chia d, thương q: tổng hiển thị là d*q + d = d*(q + 1)
+    lo, hi, small = _limits(cfg)
+    d_lo = max(1, lo)
+    d_hi = max(d_lo, max(1, small))
+    q_lo, q_hi = lo, max(lo + 1, hi)
+
+    if s2 is None:  # chỉ chặn dưới: các d khả dĩ liền nhau
+        d_from = max(d_lo, -(-s1 // (q_hi + 1)))
+        if d_from > d_hi:
+            return None
+
+        def sample(rng: np.random.Generator, cnt: int):
+            d = rng.integers(d_from, d_hi + 1, size=cnt, dtype=np.int64)
+            q = rng.integers(np.maximum(q_lo, -(-s1 // d) - 1), q_hi + 1, dtype=np.int64)
+            return d, q
+        return sample
+
+    # chặn trên s2 <= 200 nên d <= 200: liệt kê d, chọn theo số thương hợp lệ (đều trên các cặp)
+    ds = np.arange(d_lo, min(d_hi, s2) + 1, dtype=np.int64)
+    q_min = np.maximum(q_lo, -(-s1 // np.maximum(ds, 1)) - 1)
+    q_max = np.minimum(q_hi, s2 // np.maximum(ds, 1) - 1)
+    width = np.maximum(0, q_max - q_min + 1)
+    ok = width > 0
+    if not ok.any():
+        return None
+    ds, q_min, q_max, width = ds[ok], q_min[ok], q_max[ok], width[ok]
+    p = width / width.sum()
+
+    def sample(rng: np.random.Generator, cnt: int):
+        idx = rng.choice(len(ds), size=cnt, p=p)
+        return ds[idx], rng.integers(q_min[idx], q_max[idx] + 1, dtype=np.int64)
+    return sample
+
+
+def _op_sampler(cfg: GenerationConfig, op: int, interval: _Interval) -> Optional[Callable]:
+    """Hàm rút (a, b, ans) cho phép op với độ khó trong interval, None nếu không thể."""
+    bounds = _sum_bounds(op, interval)
+    if bounds is None:
+        return None
+    s1, s2 = bounds
+    lo, hi, small = _limits(cfg)
+
+    if op == DIV:
+        pairs = _div_sampler(cfg, s1, s2)
+        if pairs is None:
+            return None
+
+        def draw(rng: np.random.Generator, cnt: int):
+            d, q = pairs(rng, cnt)
+            return d * q, d, q
+        return draw
+
+    pairs = _pair_sampler(lo, small if op == MUL else hi, s1, s2)
+    if pairs is None:
+        return None
+
+    def draw(rng: np.random.Generator, cnt: int):
+        x, y = pairs(rng, cnt)
+        if op == ADD:
+            return x, y, x + y
+        if op == SUB:
+            x, y = np.maximum(x, y), np.minimum(x, y)
+            return x, y, x - y
+        return x, y, x * y
+    return draw
+
+
+def _target_intervals(cfg: GenerationConfig) -> List[Tuple[str, float, _Interval]]:
+    """(nhãn, trọng số, khoảng độ khó) từ difficulty_mix và/hoặc difficulty_range."""
+    lo, hi = cfg.difficulty_range or (0.0, 1.0)
+    if cfg.difficulty_mix is None:
+        return [(f"[{lo}, {hi}]", 1.0, (lo, hi, True))]
+
+    edges = (0.0,) + BUCKET_BOUNDS + (1.0,)
+    out = []
+    for i, name in enumerate(_BUCKETS):
+        w = cfg.difficulty_mix.get(name, 0.0)
+        b_lo, b_hi, b_inc = edges[i], edges[i + 1], name == _BUCKETS[-1]
+        i_lo, i_hi = max(lo, b_lo), min(hi, b_hi)
+        inclusive = True if hi < b_hi else b_inc  # difficulty_range là đoạn đóng
+        if w > 0 and (i_lo < i_hi or (i_lo == i_hi and inclusive)):
+            out.append((name, w, (i_lo, i_hi, inclusive)))
+        elif w > 0:
+            out.append((name, w, (1.0, 0.0, False)))  # rỗng: báo lỗi nếu được phân câu
+    return out
+
+
+def _largest_remainder(n: int, weights: Sequence[float]) -> List[int]:
+    """Chia đúng n theo tỉ lệ (làm tròn theo phần dư lớn nhất), để tỉ lệ bucket khớp chính xác."""
+    w = np.asarray(weights, dtype=float)
+    raw = n * w / w.sum()
+    counts = np.floor(raw).astype(np.int64)
+    rest = n - int(counts.sum())
+    counts[np.argsort(-(raw - counts), kind="stable")[:rest]] += 1
+    return counts.tolist()
+
+
+def _difficulty_plan(cfg: GenerationConfig, n: int) -> List[Tuple[int, Dict[int, Callable], Dict[int, int]]]:
+    """Mỗi khoảng mục tiêu: (số câu, sampler theo phép khả dĩ, trọng số phép)."""
+    ops = [OPS.index(o) for o in (cfg.operations or OPS)]
+    intervals = _target_intervals(cfg)
+    plan = []
+    for (label, _, interval), cnt in zip(intervals, _largest_remainder(n, [w for _, w, _ in intervals])):
+        samplers = {}
+        for k in set(ops):
+            fn = _op_sampler(cfg, k, interval)
+            if fn is not None:
+                samplers[k] = fn
+        if cnt > 0 and not samplers:
+            raise DifficultyUnreachable(
+                f"Không phép tính nào trong {list(cfg.operations)} với phạm vi "
+                f"{cfg.min_value}..{cfg.max_value} cho được câu có độ khó '{label}'"
+            )
+        weights = {k: c for k, c in Counter(ops).items() if k in samplers}
+        plan.append((cnt, samplers, weights))
+    return plan
+
+
+def has_difficulty_target(cfg: GenerationConfig) -> bool:
+    return cfg.difficulty_mix is not None or cfg.difficulty_range is not None
+
+
+def check_difficulty_target(cfg: GenerationConfig, n: int) -> None:
+    """Báo DifficultyUnreachable sớm (trước khi sinh/stream) nếu mục tiêu không đạt được."""
+    if has_difficulty_target(cfg):
+        _difficulty_plan(cfg, n)
+
+
+def draw_targeted_operands(
+    rng: np.random.Generator, cfg: GenerationConfig, n: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Như draw_operands nhưng mỗi câu rơi thẳng vào độ khó mục tiêu: công thức chấm
+    chỉ phụ thuộc phép tính và tổng toán hạng, nên mỗi (khoảng độ khó, phép) được
+    đổi thành khoảng tổng hợp lệ rồi rút toán hạng trong khoảng đó. Số câu mỗi
+    bucket theo đúng tỉ lệ difficulty_mix, không sinh dư, không lọc lại.
+    """
+    parts = []
+    for cnt, samplers, weights in _difficulty_plan(cfg, n):
+        if cnt == 0:
+            continue
+        keys = list(weights)
+        w = np.array([weights[k] for k in keys], dtype=float)
+        for k, c in zip(keys, rng.multinomial(cnt, w / w.sum()).tolist()):
+            if c:
+                a, b, ans = samplers[k](rng, c)
+                parts.append((np.full(c, k, dtype=np.int64), a, b, ans))
+
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    order = rng.permutation(n)
+    op_idx, a, b, ans = (np.concatenate(col)[order] for col in zip(*parts))
+    return op_idx, a, b, ans
+
+
+def score_arithmetic_batch(op_idx: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Bản vector hoá của score_arithmetic, tính thẳng từ toán hạng (không regex)."""
+    scale = np.minimum(1.0, (np.abs(a) + np.abs(b)) / 200.0)
+    return np.clip(_BASE[op_idx] + 0.5 * scale, 0.0, 1.0)
+
+
+def make_distractors_batch(answers: np.ndarray, rng: np.random.Generator) -> List[List[str]]:
+    """Sinh 3 phương án nhiễu cho cả lô đáp án nguyên."""
+    n = len(answers)
+    if n == 0:
+        return []
+    # hoán vị ngẫu nhiên 5 độ lệch mỗi dòng rồi lấy 3 cái đầu
+    order = np.argsort(rng.random((n, len(_DISTRACTOR_OFFSETS))), axis=1)[:, :3]
+    picked = (answers[:, None] + _DISTRACTOR_OFFSETS[order]).tolist()
+    out = [[str(x) for x in row] for row in picked]
+    # đáp án nhỏ (< 3) có tập ứng viên bị trùng/âm -> dùng bản từng câu
+    for i in np.flatnonzero(answers < 3).tolist():
+        out[i] = make_distractors(str(int(answers[i])), rng)
+    return out
+
+
+def _to_problems(
+    rng: np.random.Generator,
+    cfg: GenerationConfig,
+    operands: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    start: int = 1,
+) -> List[ProblemRecord]:
+    op_idx, a, b, ans = operands
+    n = len(op_idx)
+    diff = score_arithmetic_batch(op_idx, a, b)  # chấm sơ bộ
+    with stage("distractors"):
+        dis = make_distractors_batch(ans, rng) if cfg.include_distractors else [[] for _ in range(n)]
+
+    # bản ghi gọn (slots, không validate); model pydantic chỉ tạo ở biên API nếu cần
+    return [
+        ProblemRecord(i, f"{x} {OPS[k]} {y} = ?", str(z), d, "arithmetic", s, "generated")
+        for i, (k, x, y, z, s, d) in enumerate(
+            zip(op_idx.tolist(), a.tolist(), b.tolist(), ans.tolist(), diff.tolist(), dis),
+            start=start,
+        )
+    ]
+
+
+def _draw(rng: np.random.Generator, cfg: GenerationConfig, n: int):
+    if cfg.unique:
+        return draw_unique_operands(rng, cfg, n)
+    if has_difficulty_target(cfg):
+        return draw_targeted_operands(rng, cfg, n)
+    return draw_operands(rng, cfg, n)
+
+
+def generate_arithmetic(
+    cfg: GenerationConfig, rng: Optional[np.random.Generator] = None
+) -> List[ProblemRecord]:
+    if rng is None:
+        rng = make_rng(cfg.seed)
+    return _to_problems(rng, cfg, _draw(rng, cfg, cfg.count))
+
+
+def iter_arithmetic(
+    cfg: GenerationConfig,
+    batch_size: int = 500,
+    rng: Optional[np.random.Generator] = None,
+) -> Iterator[List[ProblemRecord]]:
+    """
+    Sinh cfg.count câu theo từng lô batch_size (id liên tục từ 1).
+    Bộ nhớ chỉ giữ một lô bản ghi tại một thời điểm, dùng cho các endpoint stream.
+    Với cfg.unique / độ khó mục tiêu, toán hạng (mảng int) được rút một lần để
+    không trùng giữa các lô và tỉ lệ bucket khớp trên toàn bộ đề.
+    """
+    if rng is None:
+        rng = make_rng(cfg.seed)
+    if cfg.unique or has_difficulty_target(cfg):
+        cols = _draw(rng, cfg, cfg.count)
+        for start in range(0, cfg.count, batch_size):
+            part = tuple(c[start:start + batch_size] for c in cols)
+            yield _to_problems(rng, cfg, part, start + 1)
+        return
+    for start in range(0, cfg.count, batch_size):
+        n = min(batch_size, cfg.count - start)
+        yield _to_problems(rng, cfg, draw_operands(rng, cfg, n), start + 1)
 
 # -----------------
 # Chấm & đánh giá
 # -----------------
+_ARITH_RE = re.compile(r"(\d+)\s*([+\-×÷])\s*(\d+)")
+_NUM_RE = re.compile(r"\d+")
+_OP_RE = re.compile(r"[+\-×÷]")
+_OPERAND_CAP = 10**9  # điểm bão hoà từ tổng 200, chặn để số lớn không tràn int64
+
 def score_arithmetic(text: str) -> float:
-    m = re.findall(r"(\d+)\s*([+\-×÷])\s*(\d+)", text)
+    m = _ARITH_RE.search(text)
     if not m:
         return 0.4
-    a, op, b = m[0]
+    a, op, b = m.groups()
     a, b = int(a), int(b)
     base = {"+": 0.25, "-": 0.35, "×": 0.6, "÷": 0.75}[op]
     scale = min(1.0, (abs(a) + abs(b)) / 200.0)
@@ -73,51 +530,174 @@ def score_arithmetic(text: str) -> float:
 
 def score_word(text: str) -> float:
     length = len(text)
-    nums = len(re.findall(r"\d+", text))
-    has_mult = "×" in text or "nhân" in text.lower() or "multiply" in text.lower()
-    has_div  = "÷" in text or "chia" in text.lower() or "divide" in text.lower()
+    nums = len(_NUM_RE.findall(text))
+    low = text.lower()
+    has_mult = "×" in text or "nhân" in low or "multiply" in low
+    has_div  = "÷" in text or "chia" in low or "divide" in low
     base = 0.35 + 0.05 * nums + 0.0007 * length
     if has_mult: base += 0.12
     if has_div:  base += 0.18
     return max(0.0, min(1.0, base))
 
-def score_problem(p: Problem) -> float:
+def score_problem(p: ProblemLike) -> float:
     return score_arithmetic(p.text) if p.kind == "arithmetic" else score_word(p.text)
 
+BUCKET_BOUNDS = (0.34, 0.67)  # ranh giới easy | medium | hard
+_BUCKETS = ("easy", "medium", "hard")
+
 def _tag(v: float) -> str:
-    return "easy" if v < 0.34 else "medium" if v < 0.67 else "hard"
+    return "easy" if v < BUCKET_BOUNDS[0] else "medium" if v < BUCKET_BOUNDS[1] else "hard"
 
-def evaluate_exam(problems: List[Problem]) -> Evaluation:
-    ds = [p.difficulty for p in problems if p.difficulty is not None]
-    by_kind = Counter(p.kind for p in problems)
-    by_op = Counter()
-    for p in problems:
-        m = re.findall(r"[+\-×÷]", p.text)
+
+class ScoreBatch(NamedTuple):
+    difficulty: np.ndarray          # float64, cùng thứ tự đầu vào
+    operation: List[Optional[str]]  # phép tính đầu tiên xuất hiện trong đề (None nếu không có)
+    bucket: List[str]               # easy | medium | hard
+
+
+def score_batch(problems: Sequence[ProblemLike]) -> ScoreBatch:
+    """
+    Chấm cả lô: mỗi đề chỉ được tách token một lần (số, phép tính, từ khoá,
+    độ dài), sau đó công thức của score_arithmetic/score_word được tính
+    vector hoá trên toàn bộ mảng đặc trưng. Kết quả trùng với score_problem.
+    """
+    n = len(problems)
+    is_arith = np.zeros(n, dtype=bool)
+    op_idx = np.full(n, -1, dtype=np.int64)
+    a = np.zeros(n, dtype=np.int64)
+    b = np.zeros(n, dtype=np.int64)
+    nums = np.zeros(n, dtype=np.int64)
+    length = np.zeros(n, dtype=np.int64)
+    has_mult = np.zeros(n, dtype=bool)
+    has_div = np.zeros(n, dtype=bool)
+    operation: List[Optional[str]] = [None] * n
+
+    for i, p in enumerate(problems):
+        text = p.text
+        m = _OP_RE.search(text)
         if m:
-            by_op[m[0]] += 1
-    buckets = Counter(_tag(x) for x in ds)
+            operation[i] = m.group(0)
+        if p.kind == "arithmetic":
+            is_arith[i] = True
+            m = _ARITH_RE.search(text)
+            if m:
+                a[i] = min(int(m.group(1)), _OPERAND_CAP)
+                b[i] = min(int(m.group(3)), _OPERAND_CAP)
+                op_idx[i] = OPS.index(m.group(2))
+        else:
+            low = text.lower()
+            length[i] = len(text)
+            nums[i] = len(_NUM_RE.findall(text))
+            has_mult[i] = "×" in text or "nhân" in low or "multiply" in low
+            has_div[i] = "÷" in text or "chia" in low or "divide" in low
+
+    matched = op_idx >= 0
+    arith = np.where(matched, score_arithmetic_batch(np.where(matched, op_idx, 0), a, b), 0.4)
+    word = 0.35 + 0.05 * nums + 0.0007 * length
+    word = word + 0.12 * has_mult
+    word = word + 0.18 * has_div
+    word = np.clip(word, 0.0, 1.0)
+    difficulty = np.where(is_arith, arith, word)
+
+    lo, hi = BUCKET_BOUNDS
+    bucket_idx = (difficulty >= lo).astype(np.int64) + (difficulty >= hi)
+    return ScoreBatch(difficulty, operation, [_BUCKETS[k] for k in bucket_idx.tolist()])
+
+
+def problem_operation(text: str) -> Optional[str]:
+    """Phép tính đầu tiên xuất hiện trong đề (như score_batch(...).operation)."""
+    m = _OP_RE.search(text)
+    return m.group(0) if m else None
+
+
+def _evaluation(
+    avg: Optional[float], buckets: Counter, by_kind: Counter, by_op: Counter
+) -> Evaluation:
     notes: List[str] = []
-    if ds and mean(ds) > 0.7:
+    if avg is not None and avg > 0.7:
         notes.append("Đề hơi khó, cân nhắc tăng câu + hoặc -.")
     if by_kind.get("word", 0) == 0:
         notes.append("Chưa có bài toán lời văn.")
 
     return Evaluation(
-        avg_difficulty=round(mean(ds), 3) if ds else 0.0,
-        buckets=dict(buckets),
-        by_kind=dict(by_kind),
-        by_op=dict(by_op),
+        avg_difficulty=round(avg, 3) if avg is not None else 0.0,
+        buckets={k: v for k, v in buckets.items() if v > 0},
+        by_kind={k: v for k, v in by_kind.items() if v > 0},
+        by_op={k: v for k, v in by_op.items() if v > 0},
         notes=notes,
     )
 
-def make_distractors(answer: str) -> List[str]:
+
+def evaluate_exam(problems: Sequence[ProblemLike]) -> Evaluation:
+    ds = [p.difficulty for p in problems if p.difficulty is not None]
+    by_kind = Counter(p.kind for p in problems)
+    by_op = Counter(op for op in score_batch(problems).operation if op)
+    buckets = Counter(_tag(x) for x in ds)
+    return _evaluation(mean(ds) if ds else None, buckets, by_kind, by_op)
+
+
+class ExamTally:
+    """
+    Tổng hợp chạy (running aggregates) của một đề để đánh giá tăng dần:
+    thêm/sửa/xoá một câu chỉ cập nhật tổng độ khó, số câu và các bộ đếm
+    bucket/kind/phép tính trong O(1); evaluation() cho kết quả như evaluate_exam.
+    Mỗi câu được nhận diện bằng id (put với id đã có là sửa câu đó). Tổng độ
+    khó giữ dạng Fraction (chính xác như statistics.mean) nên thêm/xoá nhiều
+    lần không tích luỹ sai số làm tròn.
+    """
+    __slots__ = ("_items", "_sum", "_buckets", "_by_kind", "_by_op")
+
+    def __init__(self, problems: Iterable[ProblemLike] = ()):
+        self._items: Dict[int, Tuple[float, str, Optional[str]]] = {}  # id -> (difficulty, kind, op)
+        self._sum = Fraction(0)
+        self._buckets: Counter = Counter()
+        self._by_kind: Counter = Counter()
+        self._by_op: Counter = Counter()
+        for p in problems:
+            self.put(p)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._items
+
+    def _apply(self, item: Tuple[float, str, Optional[str]], sign: int) -> None:
+        d, kind, op = item
+        self._sum += sign * Fraction(d)
+        self._buckets[_tag(d)] += sign
+        self._by_kind[kind] += sign
+        if op:
+            self._by_op[op] += sign
+
+    def put(self, p: ProblemLike) -> None:
+        """Thêm câu mới hoặc thay câu cùng id."""
+        self.remove(p.id)
+        item = (p.difficulty, p.kind, problem_operation(p.text))
+        self._items[p.id] = item
+        self._apply(item, 1)
+
+    def remove(self, pid: int) -> bool:
+        item = self._items.pop(pid, None)
+        if item is None:
+            return False
+        self._apply(item, -1)
+        return True
+
+    def evaluation(self) -> Evaluation:
+        n = len(self._items)
+        return _evaluation(float(self._sum / n) if n else None, self._buckets, self._by_kind, self._by_op)
+
+def make_distractors(answer: str, rng: Optional[np.random.Generator] = None) -> List[str]:
+    if rng is None:
+        rng = _fallback_rng
     try:
         val = int(answer)
         cand = {val + 1, val - 1, val + 2, val - 2, max(0, val - 3)}
         cand.discard(val)
-        out = [str(x) for x in sorted(cand, key=lambda _: random.random())][:3]
+        out = [str(x) for x in rng.permutation(sorted(cand)).tolist()][:3]
         while len(out) < 3:
-            out.append(str(val + random.randint(4, 9)))
+            out.append(str(val + int(rng.integers(4, 10))))
         return out[:3]
     except ValueError:
         base = ["Không xác định", "Chưa tính", "Thử lại"]
@@ -126,46 +706,83 @@ def make_distractors(answer: str) -> List[str]:
             out.append(f"Phương án {len(out)+1}")
         return out[:3]
 
+# -----------------
+# Ghép đề
+# -----------------
+_Entry = Tuple[float, int, ProblemLike]  # (difficulty, thứ tự trong pool, problem)
+
+
+def _index_pool(pool: Sequence[ProblemLike]) -> Dict[str, Dict[str, List[_Entry]]]:
+    """Một lượt qua pool: chia theo kind -> bucket độ khó, chấm những câu chưa có điểm."""
+    index: Dict[str, Dict[str, List[_Entry]]] = {}
+    scores = iter(score_batch([p for p in pool if not p.difficulty]).difficulty.tolist())
+    for seq, p in enumerate(pool):
+        d = p.difficulty if p.difficulty else next(scores)  # chấm nếu thiếu
+        index.setdefault(p.kind, {b: [] for b in _BUCKETS})[_tag(d)].append((d, seq, p))
+    return index
+
+
+def _round_robin_counts(sizes: List[int], k: int) -> List[int]:
+    """Số phần tử lấy từ mỗi bucket khi lấy vòng tròn (easy, medium, hard, ...) tới đủ k."""
+    counts = [0] * len(sizes)
+    active = [i for i, s in enumerate(sizes) if s > 0]
+    while k > 0 and active:
+        rounds = min(k // len(active), min(sizes[i] - counts[i] for i in active))
+        if rounds == 0:  # vòng cuối dở dang: ưu tiên bucket dễ hơn
+            for i in active[:k]:
+                counts[i] += 1
+            break
+        for i in active:
+            counts[i] += rounds
+        k -= rounds * len(active)
+        active = [i for i in active if counts[i] < sizes[i]]
+    return counts
+
+
+def _select(buckets: Dict[str, List[_Entry]], k: int, mode: Mode) -> List[_Entry]:
+    if k <= 0:
+        return []
+    if mode == "balanced":
+        lists = [buckets[b] for b in _BUCKETS]
+        counts = _round_robin_counts([len(l) for l in lists], k)
+        chosen = [heapq.nsmallest(c, l) for c, l in zip(counts, lists)]
+        return [e for rnd in zip_longest(*chosen) for e in rnd if e is not None]
+    entries = chain.from_iterable(buckets.values())
+    if mode == "hard_to_easy":
+        # cùng độ khó thì giữ thứ tự trong pool (như sorted(..., reverse=True))
+        return heapq.nlargest(k, entries, key=lambda e: (e[0], -e[1]))
+    return heapq.nsmallest(k, entries)
+
+
 def assemble_exam(
-    pool: List[Problem],
+    pool: Sequence[ProblemLike],
     total_count: int,
     mcq_count: int,
     word_count: int,
     mode: Mode,
-) -> List[Problem]:
-    # chấm nếu thiếu
-    for p in pool:
-        if p.difficulty is None or p.difficulty == 0:
-            p.difficulty = score_problem(p)
-
-    reverse = (mode == "hard_to_easy")
-    pool_sorted = sorted(pool, key=lambda x: x.difficulty, reverse=reverse)
+) -> List[ProblemRecord]:
+    """
+    Chọn đề từ pool theo mode, không sửa các phần tử của pool (trả về bản sao).
+    Mỗi kind được chọn riêng: word_count câu lời văn + phần còn lại là số học.
+    """
+    index = _index_pool(pool)
+    empty = {b: [] for b in _BUCKETS}
+    picked = (
+        _select(index.get("word", empty), word_count, mode)
+        + _select(index.get("arithmetic", empty), total_count - word_count, mode)
+    )
 
-    if mode == "balanced":
-        easies = [p for p in pool_sorted if _tag(p.difficulty) == "easy"]
-        meds   = [p for p in pool_sorted if _tag(p.difficulty) == "medium"]
-        hards  = [p for p in pool_sorted if _tag(p.difficulty) == "hard"]
-        pool_sorted = []
-        while (easies or meds or hards) and len(pool_sorted) < total_count:
-            for bucket in (easies, meds, hards):
-                if bucket and len(pool_sorted) < total_count:
-                    pool_sorted.append(bucket.pop(0))
-
-    words = [p for p in pool_sorted if p.kind == "word"]
-    arith = [p for p in pool_sorted if p.kind == "arithmetic"]
-
-    picked = words[:word_count] + arith[: (total_count - word_count)]
-
-    have_mcq = sum(1 for p in picked if p.distractors)
-    need = max(0, mcq_count - have_mcq)
-    for p in picked:
+    # bổ sung phương án nhiễu cho đủ mcq_count
+    need = max(0, mcq_count - sum(1 for _, _, p in picked if p.distractors))
+    extra: Dict[int, List[str]] = {}
+    for _, seq, p in picked:
         if need <= 0:
             break
         if p.kind == "arithmetic" and not p.distractors:
-            p.distractors = make_distractors(p.answer)
+            extra[seq] = make_distractors(p.answer)
             need -= 1
 
-    picked = sorted(picked, key=lambda x: x.difficulty)
-    for i, p in enumerate(picked, start=1):
-        p.id = i
-    return picked
+    return [
+        ProblemRecord(i, p.text, p.answer, extra.get(seq, p.distractors), p.kind, d, p.source)
+        for i, (d, seq, p) in enumerate(sorted(picked, key=lambda e: e[0]), start=1)
+    ]
@@ -1,7 +1,23 @@
+from typing import Any, Dict
 from schema import GenerationConfig
 
+PROMPT_VERSION = 1  # tăng khi đổi nội dung prompt để cache cũ tự mất hiệu lực
+_OPS_ORDER = ("+", "-", "×", "÷")
+
+def prompt_params(cfg: GenerationConfig) -> Dict[str, Any]:
+    """Các tham số (đã chuẩn hoá) quyết định nội dung prompt – dùng làm khoá cache."""
+    return {
+        "v": PROMPT_VERSION,
+        "grade": cfg.grade,
+        "ops": [o for o in _OPS_ORDER if o in cfg.operations],
+        "min": cfg.min_value,
+        "max": cfg.max_value,
+        "language": cfg.language,
+    }
+
 def build_prompt(cfg: GenerationConfig, n: int) -> str:
-    ops = ", ".join(cfg.operations)
+    params = prompt_params(cfg)
+    ops = ", ".join(params["ops"])
     if cfg.language == "vi":
         return f"""
 Bạn là giáo viên tiểu học. Hãy tạo {n} bài toán có lời văn 1–2 câu
@@ -0,0 +1,193 @@
+# backend/jobs.py
+"""
+Hàng đợi job nền cho các bản xuất lớn (/api/jobs/...), không cần broker ngoài.
+
+- submit() trả job_id ngay; job chạy như một task trên event loop, phần nặng
+  (sinh đề, render PDF) vẫn đi qua threadpool / process pool render như request
+  thường. Tối đa JOB_MAX_CONCURRENCY job chạy cùng lúc, JOB_MAX_PENDING job
+  chờ + chạy; vượt quá thì JobQueueFull (503).
+- Trạng thái, tiến độ và file kết quả lưu trong SQLite: ":memory:" mặc định,
+  hoặc file JOB_STORE_PATH để các worker uvicorn cùng đọc trạng thái/tải file
+  (job vẫn chỉ chạy trong tiến trình đã nhận nó).
+- Job và file kết quả hết hạn sau JOB_TTL giây kể từ lúc tạo / lúc xong.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from metrics import JOBS
+
+JOB_TTL = float(os.getenv("JOB_TTL", 3600))
+JOB_MAX_CONCURRENCY = int(os.getenv("JOB_MAX_CONCURRENCY", 2))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 100))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    expires REAL NOT NULL,
+    media_type TEXT,
+    filename TEXT,
+    size INTEGER,
+    artifact BLOB
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_expires ON jobs(expires);
+"""
+
+_COLS = ("id", "kind", "status", "progress", "stage", "error", "created", "started", "finished", "expires",
+         "filename", "size")
+
+
+class Artifact(NamedTuple):
+    body: bytes
+    media_type: str
+    filename: str
+
+
+ProgressFn = Callable[[float, str], None]
+JobWork = Callable[[ProgressFn], Awaitable[Artifact]]
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class JobStore:
+    def __init__(self, path: Optional[Path] = None):
+        target = ":memory:"
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            target = str(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(target, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "JobStore":
+        raw_path = os.getenv("JOB_STORE_PATH", "")  # mặc định chỉ dùng RAM
+        return cls(Path(raw_path) if raw_path else None)
+
+    def create(self, kind: str, ttl: float) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs(id, kind, status, stage, created, expires) VALUES (?, ?, 'queued', 'queued', ?, ?)",
+                (job_id, kind, now, now + ttl),
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields) -> None:
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {sets} WHERE id = ?", (*fields.values(), job_id))
+
+    def finish(self, job_id: str, artifact: Artifact, ttl: float) -> None:
+        now = time.time()
+        self.update(
+            job_id, status="done", progress=1.0, stage="done", finished=now, expires=now + ttl,
+            media_type=artifact.media_type, filename=artifact.filename, size=len(artifact.body),
+            artifact=artifact.body,
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLS)} FROM jobs WHERE id = ? AND expires > ?", (job_id, time.time())
+            ).fetchone()
+        return dict(zip(_COLS, row)) if row else None
+
+    def artifact(self, job_id: str) -> Optional[Artifact]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT artifact, media_type, filename FROM jobs"
+                " WHERE id = ? AND status = 'done' AND expires > ?",
+                (job_id, time.time()),
+            ).fetchone()
+        return Artifact(bytes(row[0]), row[1], row[2]) if row else None
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+    def purge(self) -> int:
+        """Xoá job/file đã hết hạn."""
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE expires <= ?", (time.time(),)).rowcount
+
+
+class JobManager:
+    def __init__(
+        self,
+        store: JobStore,
+        ttl: float = JOB_TTL,
+        max_concurrency: int = JOB_MAX_CONCURRENCY,
+        max_pending: int = JOB_MAX_PENDING,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._semaphore: Optional[asyncio.Semaphore] = None  # tạo trên event loop ở lần submit đầu
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, kind: str, work: JobWork) -> str:
+        """Tạo job và chạy nền; gọi từ event loop."""
+        self.store.purge()
+        if len(self._tasks) >= self.max_pending:
+            raise JobQueueFull(f"Đang có {len(self._tasks)} job chờ/chạy, thử lại sau")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        job_id = self.store.create(kind, self.ttl)
+        task = asyncio.ensure_future(self._run(job_id, kind, work))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job_id
+
+    async def _run(self, job_id: str, kind: str, work: JobWork) -> None:
+        def progress(fraction: float, stage: str) -> None:
+            self.store.update(job_id, progress=round(max(0.0, min(1.0, fraction)), 4), stage=stage)
+
+        async with self._semaphore:
+            self.store.update(job_id, status="running", stage="starting", started=time.time())
+            try:
+                artifact = await work(progress)
+            except asyncio.CancelledError:
+                self.store.update(job_id, status="cancelled", stage="cancelled", finished=time.time())
+                JOBS.inc(kind=kind, status="cancelled")
+                raise
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+                print(f"Job {job_id} failed:", detail)
+                self.store.update(job_id, status="failed", stage="failed", error=str(detail), finished=time.time())
+                JOBS.inc(kind=kind, status="failed")
+                return
+            # ghi file kết quả (có thể vài MB vào SQLite) ngoài event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.store.finish, job_id, artifact, self.ttl)
+            JOBS.inc(kind=kind, status="done")
+
+    def cancel(self, job_id: str) -> bool:
+        """Huỷ job đang chờ/chạy (nếu có) và xoá khỏi store."""
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+        return self.store.delete(job_id) or task is not None
+
+    async def close(self) -> None:
+        tasks: List[asyncio.Task] = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,24 +1,68 @@
 # main.py
-import os
-import io
-import re
-import csv
-import tempfile
-from typing import List
+import time
+_IMPORT_STARTED = time.perf_counter()  # mốc đo thời gian khởi động (import + startup)
 
-from fastapi import FastAPI, Response, UploadFile, File, HTTPException
+import os
+import sys
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Literal, Optional, Tuple
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Body, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from schema import GenerationConfig, Problem, AssembleRequest, Evaluation
+from schema import (
+    GenerationConfig,
+    StreamGenerationConfig,
+    Problem,
+    ProblemRecord,
+    AssembleRequest,
+    BankAssembleRequest,
+    BankInfo,
+    ClassSetRequest,
+    Score,
+    Evaluation,
+    EvaluationSession,
+    JobInfo,
+)
 from generator import (
     generate_arithmetic,
-    make_distractors,
+    iter_arithmetic,
+    derive_seeds,
     assemble_exam,
     evaluate_exam,
-    score_problem,
+    score_batch,
+    problem_space_size,
+    check_difficulty_target,
+    DifficultyUnreachable,
+)
+from ai_provider import generate_word_problems, close_clients, preload as preload_llm_client
+from word_templates import render_word_problems, word_rng
+from render_service import (
+    RenderService,
+    RenderBusy,
+    RenderTimeout,
+    render_pdf_bytes,
+    render_bundle_bytes,
+    render_variants_bytes,
+    render_answer_key_bytes,
+    render_class_set_pdf,
+    build_class_set_zip,
+    QUESTIONS_TITLE,
+    ANSWERS_TITLE,
 )
-from ai_provider import generate_word_problems
-from pdf import render_pdf
+from bank import ProblemBank
+from upload import parse_upload, UploadTooLarge
+from exam_sessions import ExamSessions, SessionNotFound, DuplicateProblemId
+from jobs import JobManager, JobStore, JobQueueFull, Artifact, ProgressFn
+import metrics
+from metrics import stage, PROBLEMS_GENERATED, PDF_PAGES, PDF_BYTES, REQUEST_LATENCY, RESPONSE_CACHE
+from profiling import RequestProfiler
+from response_cache import ResponseCache, CachedResponse, request_key, etag_for, etag_matches
+from serialization import dumps, dumps_events, dumps_lines, JSON_MEDIA_TYPE
 
 
 # ======================
@@ -30,7 +74,22 @@ ALLOWED = [
     o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.strip()
 ]
 
-app = FastAPI(title="AI Math Problem Generator API")
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """Vòng đời app: báo cáo khởi động + warm-up tuỳ chọn, dọn dẹp khi tắt (xem phần STARTUP)."""
+    _startup_report()
+    yield
+    await _shutdown()
+
+
+app = FastAPI(title="AI Math Problem Generator API", lifespan=_lifespan)
+bank = ProblemBank.from_env()
+renderer = RenderService()
+profiler = RequestProfiler()
+response_cache = ResponseCache.from_env()
+exam_sessions = ExamSessions()
+jobs = JobManager(JobStore.from_env())
+_IMPORTED = time.perf_counter()
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,6 +97,7 @@ app.add_middleware(
     allow_origin_regex=r"https://.*\.vercel\.app$",  # + mọi subdomain vercel.app (preview/prod)
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Location"],        # ETag để gửi lại qua If-None-Match, Location của job nền
     allow_credentials=False,                    # để True nếu cần gửi cookie/Authorization kèm credentials
     max_age=86400,
 )
@@ -54,77 +114,430 @@ def root():
 def health():
     return {"ok": True}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 # ======================
-# H E L P E R S
+# S T A R T U P   &   W A R M - U P
 # ======================
-def _build_problems(cfg: GenerationConfig) -> List[Problem]:
+# Khởi động nhanh: openai và ReportLab chỉ được import khi cần (ReportLab chỉ nằm
+# trong process render). Warm-up nạp trước mọi thứ cho request đầu tiên; health
+# check có thể gọi /api/warmup, hoặc bật WARMUP_ON_STARTUP=1 để chạy ngầm khi khởi động.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+_LAZY_MODULES = ("openai", "httpx", "reportlab", "dotenv")
+
+_startup: Dict[str, Optional[float]] = {"import_s": round(_IMPORTED - _IMPORT_STARTED, 4), "ready_s": None}
+_warmup_task: Optional[asyncio.Future] = None
+
+
+async def _run_warm_up() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+
+    async def timed(name: str, awaitable) -> None:
+        t0 = time.perf_counter()
+        with stage(f"warmup.{name}"):
+            await awaitable
+        timings[name] = round(time.perf_counter() - t0, 4)
+
+    cfg = GenerationConfig(grade=3, operations=["+", "-", "×", "÷"], count=20, min_value=1, max_value=100, seed=0)
+    await timed("generator", run_in_threadpool(lambda: score_batch(generate_arithmetic(cfg))))
+    if os.getenv("OPENAI_API_KEY"):
+        await timed("llm_client", run_in_threadpool(preload_llm_client))
+    await timed("render", renderer.warm_up())
+    return timings
+
+
+async def warm_up() -> Dict[str, float]:
+    """Chạy warm-up một lần (các lời gọi đồng thời dùng chung); lần trước lỗi thì chạy lại."""
+    global _warmup_task
+    if _warmup_task is None or (_warmup_task.done() and (_warmup_task.cancelled() or _warmup_task.exception())):
+        _warmup_task = asyncio.ensure_future(_run_warm_up())
+    return await asyncio.shield(_warmup_task)
+
+
+def _startup_report() -> None:
+    _startup["ready_s"] = round(time.perf_counter() - _IMPORT_STARTED, 4)
+    print(f"Startup: imports {_startup['import_s']:.3f}s, ready {_startup['ready_s']:.3f}s")
+    if WARMUP_ON_STARTUP:
+        asyncio.ensure_future(warm_up())
+
+@app.get("/api/warmup")
+async def api_warmup():
+    try:
+        timings = await warm_up()
+    except Exception as e:
+        raise HTTPException(503, f"Warm-up failed: {e}")
+    return {"ok": True, "warmup_s": timings}
+
+def _warmup_status() -> Tuple[str, Optional[Dict[str, float]]]:
+    task = _warmup_task
+    if task is None:
+        return "not_started", None
+    if not task.done():
+        return "running", None
+    if task.cancelled() or task.exception():
+        return "failed", None
+    return "done", task.result()
+
+@app.get("/api/startup")
+def api_startup():
+    """Báo cáo thời gian khởi động (tính từ lúc bắt đầu import main) và trạng thái warm-up."""
+    status, timings = _warmup_status()
+    return {
+        **_startup,
+        "warmup": status,
+        "warmup_s": timings,
+        "loaded": {name: name in sys.modules for name in _LAZY_MODULES},  # module nặng đã được nạp chưa
+    }
+
+async def _shutdown() -> None:
+    await jobs.close()
+    await close_clients()
+    renderer.shutdown()
+
+
+# ======================
+# M E T R I C S
+# ======================
+@app.middleware("http")
+async def _observe(request: Request, call_next):
     """
-    Sinh đề theo cấu hình:
-    - count: tổng số câu
-    - word_count: số câu lời văn (nếu None thì tự suy từ include_word_problems)
-    - include_distractors: thêm lựa chọn nhiễu cho câu số học
+    Histogram thời gian theo route (dạng mẫu, vd. /api/banks/{bank_id}) + profile request chậm.
+    Với StreamingResponse chỉ tính tới lúc gửi header, phần body stream không nằm trong số đo.
     """
+    session = profiler.start()
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - t0
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REQUEST_LATENCY.observe(elapsed, method=request.method, route=path, status=str(status))
+        profiler.finish(session, elapsed, f"{request.method} {path}")
+
+
+# ======================
+# H E L P E R S
+# ======================
+PDF_CHUNK_SIZE = 64 * 1024
+STREAM_BATCH_SIZE = 500
+CLASS_SET_WORD_POOL = 200  # số câu lời văn tối đa lấy chung cho một bộ đề cả lớp
+STREAM_WORD_LLM_MAX = 200  # số câu lời văn tối đa hỏi LLM cho một stream, phần còn lại sinh từ mẫu theo lô
+RENDER_RETRY_AFTER = 5  # giây, gợi ý cho client khi pool render đang đầy
+
+
+def _require_bank(bank_id: str) -> None:
+    if not bank.exists(bank_id):
+        raise HTTPException(404, "Không tìm thấy ngân hàng câu hỏi")
+
+
+def _split_counts(cfg: GenerationConfig) -> Tuple[int, int]:
+    """(số câu số học, số câu lời văn) theo cấu hình."""
     total = cfg.count
     target_word = (
         cfg.word_count if cfg.word_count is not None
         else (cfg.count // 3 if cfg.include_word_problems else 0)
     )
     target_word = max(0, min(total, target_word))
-    target_mcq = total - target_word
+    return total - target_word, target_word
 
-    # 1) Sinh câu số học
-    arith_cfg = cfg.model_copy(update={"count": target_mcq})
-    problems = generate_arithmetic(arith_cfg)
 
-    # 2) Sinh câu lời văn
-    if target_word > 0:
-        pairs = generate_word_problems(cfg, target_word)  # List[Tuple[q, a]]
-        start = len(problems) + 1
-        for idx, (q, a) in enumerate(pairs, start=start):
-            problems.append(Problem(id=idx, text=q, answer=a, kind="word"))
+def _check_feasible(cfg: GenerationConfig) -> None:
+    """
+    422 trước khi sinh/stream nếu cấu hình không thể thoả:
+    - cfg.unique mà phạm vi số không đủ bài khác nhau
+    - độ khó mục tiêu mà không phép tính nào đạt được
+    """
+    need = _split_counts(cfg)[0]
+    if cfg.unique:
+        size = problem_space_size(cfg)
+        if need > size:
+            raise HTTPException(
+                422, f"Chỉ có {size} câu số học khác nhau với phạm vi này, không đủ {need} câu không trùng"
+            )
+    try:
+        check_difficulty_target(cfg, need)
+    except DifficultyUnreachable as e:
+        raise HTTPException(422, str(e))
+
 
-    # 3) Thêm distractors nếu bật
-    if cfg.include_distractors:
-        for p in problems:
-            if p.kind == "arithmetic":
-                p.distractors = make_distractors(p.answer)
+def _generate_arithmetic_timed(cfg: GenerationConfig) -> List[ProblemRecord]:
+    with stage("generate_arithmetic"):
+        return generate_arithmetic(cfg)
 
-    # 4) Đánh số lại id
-    for i, p in enumerate(problems, start=1):
-        p.id = i
 
+async def _build_problems(
+    cfg: GenerationConfig, word_pairs: Optional[List[Tuple[str, str]]] = None
+) -> List[ProblemRecord]:
+    """
+    Sinh đề theo cấu hình:
+    - count: tổng số câu
+    - word_count: số câu lời văn (nếu None thì tự suy từ include_word_problems)
+    - include_distractors: thêm lựa chọn nhiễu cho câu số học
+    - word_pairs: câu lời văn có sẵn (vd. pool dùng chung cho cả bộ đề), bỏ qua lời gọi LLM
+    """
+    _check_feasible(cfg)
+    target_mcq, target_word = _split_counts(cfg)
+
+    # 1) Sinh câu số học (CPU, chạy trong threadpool) song song với
+    # 2) câu lời văn (I/O tới OpenAI, chạy trên event loop)
+    arith_cfg = cfg.model_copy(update={"count": target_mcq})
+    arith = run_in_threadpool(_generate_arithmetic_timed, arith_cfg)
+    with stage("build_problems.wait"):
+        if word_pairs is not None:
+            problems, pairs = await arith, word_pairs[:target_word]
+        elif target_word > 0:
+            problems, pairs = await asyncio.gather(
+                arith, generate_word_problems(cfg, target_word)  # List[Tuple[q, a]]
+            )
+        else:
+            problems, pairs = await arith, []
+    PROBLEMS_GENERATED.inc(len(problems), kind="arithmetic")
+    PROBLEMS_GENERATED.inc(len(pairs), kind="word")
+
+    # 3) Câu lời văn nối tiếp, id liên tục sau câu số học (đã đánh số từ 1)
+    # (distractors cho câu số học đã được generate_arithmetic sinh theo rng của request)
+    problems.extend(
+        ProblemRecord(idx, q, a, kind="word", source="generated")
+        for idx, (q, a) in enumerate(pairs, start=len(problems) + 1)
+    )
     return problems
 
 
-def _parse_uploaded_text(data: str) -> List[Problem]:
+def _encode_batch(problems: List[ProblemRecord], fmt: str) -> bytes:
+    with stage("serialize"):
+        if fmt == "sse":
+            return dumps_events(problems, "problem")
+        return dumps_lines(problems)
+
+
+async def _stream_problems(cfg: GenerationConfig, fmt: str) -> AsyncIterator[bytes]:
     """
-    Parse .txt/.csv đơn giản:
-    - Hỗ trợ phân tách bằng '|' hoặc ',' hoặc '... đáp án: ...'
+    Giống _build_problems nhưng trả dần từng lô: câu số học sinh theo lô
+    trong threadpool, câu lời văn gửi sau cùng cũng theo lô. Chỉ tối đa
+    STREAM_WORD_LLM_MAX câu lời văn đầu được hỏi LLM (chạy song song từ đầu),
+    phần còn lại sinh từ mẫu nội bộ từng lô, nên bộ nhớ không tăng theo count.
+    """
+    target_mcq, target_word = _split_counts(cfg)
+    llm_word = min(target_word, STREAM_WORD_LLM_MAX)
+    words = (
+        asyncio.ensure_future(generate_word_problems(cfg, llm_word))
+        if llm_word > 0 else None
+    )
+    try:
+        batches = iter_arithmetic(cfg.model_copy(update={"count": target_mcq}), STREAM_BATCH_SIZE)
+        while True:
+            batch = await run_in_threadpool(next, batches, None)
+            if batch is None:
+                break
+            PROBLEMS_GENERATED.inc(len(batch), kind="arithmetic")
+            yield _encode_batch(batch, fmt)
+
+        if words is not None:
+            pairs = await words
+            rng = word_rng(cfg.seed, stream=1)  # phần bù độc lập với luồng mẫu trong generate_word_problems
+            for start in range(0, target_word, STREAM_BATCH_SIZE):
+                size = min(STREAM_BATCH_SIZE, target_word - start)
+                chunk = pairs[start:start + size]
+                if len(chunk) < size:
+                    chunk += await run_in_threadpool(render_word_problems, cfg, size - len(chunk), rng)
+                PROBLEMS_GENERATED.inc(len(chunk), kind="word")
+                yield _encode_batch([
+                    ProblemRecord(i, q, a, kind="word", source="generated")
+                    for i, (q, a) in enumerate(chunk, start=target_mcq + start + 1)
+                ], fmt)
+        if fmt == "sse":
+            yield b"event: end\ndata: {}\n\n"
+    finally:
+        if words is not None and not words.done():
+            words.cancel()  # client ngắt kết nối giữa chừng
+
+
+def _iter_bytes(data: bytes, chunk_size: int = PDF_CHUNK_SIZE) -> Iterator[bytes]:
+    """Trả dần nội dung theo từng khúc qua memoryview, không sao chép cả file thêm lần nữa."""
+    view = memoryview(data)
+    for i in range(0, len(view), chunk_size):
+        yield view[i:i + chunk_size].tobytes()
+
+
+def _bytes_response(
+    data: bytes, media_type: str, filename: str, headers: Optional[Dict[str, str]] = None
+) -> StreamingResponse:
+    return StreamingResponse(
+        _iter_bytes(data),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(len(data)),
+            **(headers or {}),
+        },
+    )
+
+
+def _json_response(data, headers: Optional[Dict[str, str]] = None) -> Response:
     """
-    out: List[Problem] = []
-    lines = [l.strip() for l in data.splitlines() if l.strip()]
-
-    if any(("," in l) or ("|" in l) for l in lines):
-        reader = csv.reader(io.StringIO("\n".join(lines)), delimiter="|")
-        for i, row in enumerate(reader, start=1):
-            if len(row) == 1:
-                row = next(csv.reader([row[0]], delimiter=","))  # fallback dấu ','
-            if not row:
-                continue
-            q = row[0].strip()
-            a = row[1].strip() if len(row) > 1 else ""
-            kind = "arithmetic" if re.search(r"[+\-×÷]", q) else "word"
-            out.append(Problem(id=i, text=q, answer=a, kind=kind, source="uploaded"))
+    Trả JSON đã mã hoá sẵn (orjson), bỏ qua bước validate + serialize của
+    response_model; response_model vẫn được khai báo để sinh tài liệu OpenAPI.
+    """
+    with stage("serialize"):
+        body = dumps(data)
+    return Response(body, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def _cache_key(route: str, cfg: GenerationConfig, **params) -> Optional[str]:
+    """Khoá cache nếu phản hồi là hàm thuần của cấu hình: có seed và không gọi LLM."""
+    if cfg.seed is None:
+        return None
+    _, target_word = _split_counts(cfg)
+    if target_word > 0 and os.getenv("OPENAI_API_KEY"):
+        return None
+    return request_key(route, cfg, **params)
+
+
+def _cached_response(key: str, resp: CachedResponse) -> Response:
+    headers = {"ETag": etag_for(key)}
+    if resp.filename:
+        return _bytes_response(resp.body, resp.media_type, resp.filename, headers)
+    return Response(resp.body, media_type=resp.media_type, headers=headers)
+
+
+async def _cache_lookup(key: Optional[str], if_none_match: Optional[str]) -> Optional[Response]:
+    """304 nếu client đã có bản này, phản hồi từ cache nếu có, ngược lại None."""
+    if key is None:
+        return None
+    etag = etag_for(key)
+    if etag_matches(if_none_match, etag):
+        RESPONSE_CACHE.inc(result="not_modified")
+        return Response(status_code=304, headers={"ETag": etag})
+    hit, tier = response_cache.get_memory(key), "memory"
+    if hit is None and response_cache.has_disk:
+        hit, tier = await run_in_threadpool(response_cache.get_disk, key), "disk"
+    if hit is None:
+        RESPONSE_CACHE.inc(result="miss")
+        return None
+    RESPONSE_CACHE.inc(result=f"hit_{tier}")
+    return _cached_response(key, hit)
+
+
+async def _cache_store(key: str, resp: CachedResponse) -> Response:
+    if response_cache.has_disk:
+        await run_in_threadpool(response_cache.put, key, resp)
+    else:
+        response_cache.put(key, resp)
+    return _cached_response(key, resp)
+
+
+def _record_pdf(job: str, result) -> None:
+    """Cộng số trang/byte từ kết quả render: bytes, (bytes, media, filename) hoặc [(idx, pdf, pdf)]."""
+    if isinstance(result, tuple):
+        blobs = [result[0]]
+    elif isinstance(result, list):
+        blobs = [b for item in result for b in item[1:]]
     else:
-        for i, l in enumerate(lines, start=1):
-            m = re.split(r"đáp án[:：]|answer[:：]", l, flags=re.I)
-            q = m[0].strip()
-            a = m[1].strip() if len(m) > 1 else ""
-            kind = "arithmetic" if re.search(r"[+\-×÷]", q) else "word"
-            out.append(Problem(id=i, text=q, answer=a, kind=kind, source="uploaded"))
+        blobs = [result]
+    for data in blobs:
+        PDF_BYTES.inc(len(data), job=job)
+        PDF_PAGES.inc(metrics.count_pdf_pages(data), job=job)
 
-    return out
+
+async def _render(fn, *args):
+    """Đẩy job render sang process pool, đổi lỗi bận/quá hạn thành mã HTTP."""
+    try:
+        with stage(f"render_pdf.{fn.__name__}"):  # gồm cả thời gian chờ trong hàng đợi pool
+            result = await renderer.run(fn, *args)
+    except RenderBusy as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(RENDER_RETRY_AFTER)})
+    except RenderTimeout as e:
+        raise HTTPException(504, str(e))
+    _record_pdf(fn.__name__, result)
+    return result
+
+
+def _no_progress(fraction: float, stage: str) -> None:
+    pass
+
+
+async def _export_worksheet(
+    cfg: GenerationConfig, with_answers: bool, progress: ProgressFn = _no_progress
+) -> CachedResponse:
+    progress(0.05, "generate")
+    problems = await _build_problems(cfg)
+    progress(0.5, "render")
+    if with_answers:
+        data = await _render(render_pdf_bytes, ANSWERS_TITLE, problems, True)
+        return CachedResponse(data, "application/pdf", "worksheet_answers.pdf")
+    data = await _render(render_pdf_bytes, QUESTIONS_TITLE, problems, False)
+    return CachedResponse(data, "application/pdf", "worksheet_questions.pdf")
+
+
+async def _export_bundle(
+    cfg: GenerationConfig, fmt: str, progress: ProgressFn = _no_progress
+) -> CachedResponse:
+    # sinh đề đúng 1 lần (kể cả lời gọi OpenAI) cho cả câu hỏi lẫn đáp án
+    progress(0.05, "generate")
+    problems = await _build_problems(cfg)
+    progress(0.5, "render")
+    return CachedResponse(*await _render(render_bundle_bytes, problems, fmt))
+
+
+async def _export_class_set(req: ClassSetRequest, progress: ProgressFn = _no_progress) -> CachedResponse:
+    """
+    Mỗi học sinh một biến thể của cùng một đề:
+    - seed mỗi biến thể suy ra độc lập từ base_seed
+    - câu lời văn lấy một lần thành pool chung rồi mỗi biến thể rút ngẫu nhiên
+    - các biến thể được sinh và render song song trên process pool
+    """
+    cfg, n = req.config, req.variants
+    seeds = derive_seeds(req.base_seed, n)
+    _, target_word = _split_counts(cfg)
+
+    progress(0.05, "generate")
+    pool: List[Tuple[str, str]] = []
+    if target_word > 0:
+        # pool cũng theo base_seed để cùng base_seed dựng lại đúng bộ đề (manifest.json)
+        pool = await generate_word_problems(
+            cfg.model_copy(update={"seed": req.base_seed}),
+            max(target_word, min(target_word * n, CLASS_SET_WORD_POOL)),
+        )
+    variants = await asyncio.gather(*(
+        _build_problems(
+            cfg.model_copy(update={"seed": s}),
+            word_pairs=random.Random(s).sample(pool, target_word) if target_word > 0 else [],
+        )
+        for s in seeds
+    ))
+    numbered = list(enumerate(variants, start=1))
+    progress(0.3, "render")
+
+    if req.format == "pdf":
+        data = await _render(render_class_set_pdf, numbered)
+        return CachedResponse(data, "application/pdf", "class_set.pdf")
+
+    groups = max(1, min(n, renderer.workers))
+    done = 0
+
+    async def tracked(fn, *args):
+        nonlocal done
+        result = await _render(fn, *args)
+        done += 1
+        progress(0.3 + 0.6 * done / (groups + 1), "render")
+        return result
+
+    rendered_groups, answer_key = await asyncio.gather(
+        asyncio.gather(*(tracked(render_variants_bytes, numbered[i::groups]) for i in range(groups))),
+        tracked(render_answer_key_bytes, numbered),
+    )
+    progress(0.9, "package")
+    manifest = {"base_seed": req.base_seed, "variants": [{"index": i, "seed": s} for i, s in enumerate(seeds, start=1)]}
+    data = await run_in_threadpool(
+        build_class_set_zip, [r for grp in rendered_groups for r in grp], answer_key, manifest
+    )
+    return CachedResponse(data, "application/zip", "class_set.zip")
 
 
 # ======================
@@ -132,56 +545,87 @@ def _parse_uploaded_text(data: str) -> List[Problem]:
 # ======================
 
 @app.post("/api/generate", response_model=List[Problem])
-def api_generate(cfg: GenerationConfig) -> List[Problem]:
-    return _build_problems(cfg)
+async def api_generate(
+    cfg: GenerationConfig,
+    bank_id: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    if bank_id:  # kiểm tra trước khi sinh đề (có thể tốn lời gọi LLM)
+        _require_bank(bank_id)
+    key = None if bank_id else _cache_key("generate", cfg)  # lưu vào bank là tác dụng phụ: không cache
+    cached = await _cache_lookup(key, if_none_match)
+    if cached is not None:
+        return cached
+
+    problems = await _build_problems(cfg)
+    if bank_id:  # lưu luôn vào ngân hàng câu hỏi nếu được chỉ định
+        await run_in_threadpool(bank.add, bank_id, problems)
+    if key is None:
+        return _json_response(problems)
+    with stage("serialize"):
+        body = dumps(problems)
+    return await _cache_store(key, CachedResponse(body, JSON_MEDIA_TYPE))
+
+
+@app.post("/api/generate/stream")
+async def api_generate_stream(
+    cfg: StreamGenerationConfig,
+    fmt: Literal["ndjson", "sse"] = Query("ndjson", alias="format"),
+):
+    """Stream bộ đề lớn (tới STREAM_MAX_COUNT câu) dạng NDJSON hoặc Server-Sent Events."""
+    _check_feasible(cfg)
+    if fmt == "sse":
+        return StreamingResponse(
+            _stream_problems(cfg, fmt),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return StreamingResponse(_stream_problems(cfg, fmt), media_type="application/x-ndjson")
 
 
 @app.post("/api/export/questions")
-def api_export_questions(cfg: GenerationConfig):
-    problems = _build_problems(cfg)
-    fd, path = tempfile.mkstemp(suffix="_questions.pdf")
-    os.close(fd)
-    render_pdf(path, "BÀI TẬP TOÁN - CÂU HỎI", problems, with_answers=False)
-    try:
-        with open(path, "rb") as f:
-            data = f.read()
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
-
-    return Response(
-        content=data,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "attachment; filename=worksheet_questions.pdf"},
-    )
+async def api_export_questions(cfg: GenerationConfig, if_none_match: Optional[str] = Header(None)):
+    key = _cache_key("export/questions", cfg)
+    cached = await _cache_lookup(key, if_none_match)
+    if cached is not None:
+        return cached
+    resp = await _export_worksheet(cfg, False)
+    return await _cache_store(key, resp) if key else _bytes_response(*resp)
 
 
 @app.post("/api/export/answers")
-def api_export_answers(cfg: GenerationConfig):
-    problems = _build_problems(cfg)
-    fd, path = tempfile.mkstemp(suffix="_answers.pdf")
-    os.close(fd)
-    render_pdf(path, "BÀI TẬP TOÁN - ĐÁP ÁN", problems, with_answers=True)
-    try:
-        with open(path, "rb") as f:
-            data = f.read()
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
-
-    return Response(
-        content=data,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "attachment; filename=worksheet_answers.pdf"},
-    )
+async def api_export_answers(cfg: GenerationConfig, if_none_match: Optional[str] = Header(None)):
+    key = _cache_key("export/answers", cfg)
+    cached = await _cache_lookup(key, if_none_match)
+    if cached is not None:
+        return cached
+    resp = await _export_worksheet(cfg, True)
+    return await _cache_store(key, resp) if key else _bytes_response(*resp)
+
+
+@app.post("/api/export/bundle")
+async def api_export_bundle(
+    cfg: GenerationConfig,
+    fmt: Literal["zip", "pdf"] = Query("zip", alias="format"),
+    if_none_match: Optional[str] = Header(None),
+):
+    key = _cache_key("export/bundle", cfg, format=fmt)
+    cached = await _cache_lookup(key, if_none_match)
+    if cached is not None:
+        return cached
+    resp = await _export_bundle(cfg, fmt)
+    return await _cache_store(key, resp) if key else _bytes_response(*resp)
+
+
+@app.post("/api/export/class-set")
+async def api_export_class_set(req: ClassSetRequest):
+    """Xuất bộ đề cho cả lớp (xem _export_class_set); bộ lớn nên dùng /api/jobs/export/class-set."""
+    _check_feasible(req.config)  # trước khi gọi LLM lấy pool câu lời văn chung
+    return _bytes_response(*await _export_class_set(req))
 
 
 @app.post("/api/upload", response_model=List[Problem])
-async def api_upload(file: UploadFile = File(...)) -> List[Problem]:
+async def api_upload(file: UploadFile = File(...), bank_id: Optional[str] = None):
     if file.content_type not in (
         "text/plain",
         "text/csv",
@@ -189,19 +633,210 @@ async def api_upload(file: UploadFile = File(...)) -> List[Problem]:
         "application/octet-stream",  # một số trình duyệt gửi vậy cho .txt
     ):
         raise HTTPException(400, "Hiện hỗ trợ .txt, .csv")
+    if bank_id:
+        _require_bank(bank_id)
 
-    raw = (await file.read()).decode("utf-8", errors="ignore")
-    problems = _parse_uploaded_text(raw)
-    for p in problems:
-        p.difficulty = score_problem(p)
-    return problems
+    try:
+        # đọc/giải mã/parse/chấm theo khúc trong threadpool, không nạp cả file vào RAM
+        with stage("upload_parse"):
+            problems = await run_in_threadpool(parse_upload, file.file)
+    except UploadTooLarge as e:
+        raise HTTPException(413, str(e))
+    if bank_id:
+        await run_in_threadpool(bank.add, bank_id, problems)
+    return _json_response(problems)
 
 
 @app.post("/api/assemble", response_model=List[Problem])
-def api_assemble(req: AssembleRequest) -> List[Problem]:
-    return assemble_exam(req.pool, req.total_count, req.mcq_count, req.word_count, req.mode)
+def api_assemble(req: AssembleRequest):
+    with stage("assemble_exam"):
+        picked = assemble_exam(req.pool, req.total_count, req.mcq_count, req.word_count, req.mode)
+    return _json_response(picked)
+
+
+@app.post("/api/assemble/bank", response_model=List[Problem])
+def api_assemble_bank(req: BankAssembleRequest):
+    """Ghép đề từ ngân hàng đã lưu: chỉ gửi bank_id + bộ lọc thay vì cả pool."""
+    _require_bank(req.bank_id)
+    pool = []
+    short: List[str] = []
+    with stage("bank_candidates"):
+        for kind, k in (("word", req.word_count), ("arithmetic", req.total_count - req.word_count)):
+            found = bank.candidates(req.bank_id, kind, k, req.mode, req.operations, req.sources)
+            if len(found) < k:
+                short.append(f"{kind}: {len(found)}/{k}")
+            pool += found
+    if short:
+        raise HTTPException(422, "Ngân hàng không đủ câu khớp bộ lọc (" + ", ".join(short) + ")")
+    with stage("assemble_exam"):
+        picked = assemble_exam(pool, req.total_count, req.mcq_count, req.word_count, req.mode)
+    return _json_response(picked)
+
+
+@app.post("/api/banks", response_model=BankInfo)
+def api_bank_create(
+    problems: List[Problem] = Body(default=[]),
+    name: Optional[str] = None,
+) -> BankInfo:
+    bank_id = bank.create(name)
+    if problems:
+        bank.add(bank_id, problems)
+    return BankInfo(**bank.info(bank_id))
+
+
+@app.get("/api/banks/{bank_id}", response_model=BankInfo)
+def api_bank_info(bank_id: str) -> BankInfo:
+    _require_bank(bank_id)
+    return BankInfo(**bank.info(bank_id))
+
+
+@app.post("/api/banks/{bank_id}/problems", response_model=BankInfo)
+def api_bank_add(bank_id: str, problems: List[Problem]) -> BankInfo:
+    _require_bank(bank_id)
+    bank.add(bank_id, problems)
+    return BankInfo(**bank.info(bank_id))
+
+
+@app.post("/api/score", response_model=List[Score])
+def api_score(problems: List[Problem]):
+    """Chấm hàng loạt: độ khó, phép tính và bucket cho từng câu."""
+    scored = score_batch(problems)
+    return _json_response([
+        {"id": p.id, "difficulty": d, "operation": op, "bucket": bk}
+        for p, d, op, bk in zip(problems, scored.difficulty.tolist(), scored.operation, scored.bucket)
+    ])
 
 
 @app.post("/api/evaluate", response_model=Evaluation)
 def api_evaluate(problems: List[Problem]) -> Evaluation:
     return evaluate_exam(problems)
+
+
+_SESSION_NOT_FOUND = "Không tìm thấy phiên đánh giá (có thể đã hết hạn)"
+
+
+def _session_state(session_id: str, state: Tuple[int, Evaluation]) -> EvaluationSession:
+    count, evaluation = state
+    return EvaluationSession(session_id=session_id, count=count, evaluation=evaluation)
+
+
+def _session_call(fn, session_id: str, *args):
+    try:
+        return fn(session_id, *args)
+    except SessionNotFound:
+        raise HTTPException(404, _SESSION_NOT_FOUND)
+
+
+@app.post("/api/evaluate/sessions", response_model=EvaluationSession)
+def api_evaluate_session_create(problems: List[Problem] = Body(default=[])) -> EvaluationSession:
+    """Mở phiên đánh giá tăng dần với đề hiện tại; các lần sửa sau chỉ cần gửi một câu."""
+    try:
+        session_id, count, evaluation = exam_sessions.create(problems)
+    except DuplicateProblemId as e:
+        raise HTTPException(422, str(e))
+    return EvaluationSession(session_id=session_id, count=count, evaluation=evaluation)
+
+
+@app.get("/api/evaluate/sessions/{session_id}", response_model=EvaluationSession)
+def api_evaluate_session_get(session_id: str) -> EvaluationSession:
+    return _session_state(session_id, _session_call(exam_sessions.evaluation, session_id))
+
+
+@app.put("/api/evaluate/sessions/{session_id}/problems/{problem_id}", response_model=EvaluationSession)
+def api_evaluate_session_put(session_id: str, problem_id: int, problem: Problem) -> EvaluationSession:
+    """Thêm hoặc sửa một câu (id lấy theo đường dẫn)."""
+    problem.id = problem_id
+    return _session_state(session_id, _session_call(exam_sessions.put, session_id, problem))
+
+
+@app.delete("/api/evaluate/sessions/{session_id}/problems/{problem_id}", response_model=EvaluationSession)
+def api_evaluate_session_remove(session_id: str, problem_id: int) -> EvaluationSession:
+    state = _session_call(exam_sessions.remove, session_id, problem_id)
+    if state is None:
+        raise HTTPException(404, "Phiên không có câu này")
+    return _session_state(session_id, state)
+
+
+@app.delete("/api/evaluate/sessions/{session_id}", status_code=204)
+def api_evaluate_session_close(session_id: str) -> Response:
+    if not exam_sessions.close(session_id):
+        raise HTTPException(404, _SESSION_NOT_FOUND)
+    return Response(status_code=204)
+
+
+# ======================
+# J O B S   (xuất file chạy nền)
+# ======================
+def _job_info(job_id: str) -> JobInfo:
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Không tìm thấy job (có thể đã hết hạn)")
+    info = JobInfo(job_id=job.pop("id"), **job)
+    if info.status == "done":
+        info.download_url = f"/api/jobs/{job_id}/download"
+    return info
+
+
+def _submit_job(kind: str, response: Response, export) -> JobInfo:
+    async def work(progress: ProgressFn) -> Artifact:
+        return Artifact(*await export(progress))
+
+    try:
+        job_id = jobs.submit(kind, work)
+    except JobQueueFull as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(RENDER_RETRY_AFTER)})
+    response.headers["Location"] = f"/api/jobs/{job_id}"
+    return _job_info(job_id)
+
+
+@app.post("/api/jobs/export/questions", response_model=JobInfo, status_code=202)
+async def api_job_export_questions(cfg: GenerationConfig, response: Response) -> JobInfo:
+    _check_feasible(cfg)
+    return _submit_job("questions", response, lambda progress: _export_worksheet(cfg, False, progress))
+
+
+@app.post("/api/jobs/export/answers", response_model=JobInfo, status_code=202)
+async def api_job_export_answers(cfg: GenerationConfig, response: Response) -> JobInfo:
+    _check_feasible(cfg)
+    return _submit_job("answers", response, lambda progress: _export_worksheet(cfg, True, progress))
+
+
+@app.post("/api/jobs/export/bundle", response_model=JobInfo, status_code=202)
+async def api_job_export_bundle(
+    cfg: GenerationConfig,
+    response: Response,
+    fmt: Literal["zip", "pdf"] = Query("zip", alias="format"),
+) -> JobInfo:
+    _check_feasible(cfg)
+    return _submit_job("bundle", response, lambda progress: _export_bundle(cfg, fmt, progress))
+
+
+@app.post("/api/jobs/export/class-set", response_model=JobInfo, status_code=202)
+async def api_job_export_class_set(req: ClassSetRequest, response: Response) -> JobInfo:
+    _check_feasible(req.config)
+    return _submit_job("class-set", response, lambda progress: _export_class_set(req, progress))
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobInfo)
+def api_job_status(job_id: str) -> JobInfo:
+    """Trạng thái + tiến độ (0..1); khi status = done thì tải file qua download_url."""
+    return _job_info(job_id)
+
+
+@app.get("/api/jobs/{job_id}/download")
+def api_job_download(job_id: str):
+    info = _job_info(job_id)
+    if info.status != "done":
+        raise HTTPException(409, f"Job chưa xong (status: {info.status})" + (f": {info.error}" if info.error else ""))
+    artifact = jobs.store.artifact(job_id)
+    if artifact is None:  # vừa hết hạn
+        raise HTTPException(404, "Không tìm thấy job (có thể đã hết hạn)")
+    return _bytes_response(*artifact)
+
+
+@app.delete("/api/jobs/{job_id}", status_code=204)
+async def api_job_cancel(job_id: str) -> Response:
+    """Huỷ job đang chờ/chạy, hoặc xoá sớm file kết quả."""
+    if not jobs.cancel(job_id):
+        raise HTTPException(404, "Không tìm thấy job (có thể đã hết hạn)")
+    return Response(status_code=204)
@@ -0,0 +1,173 @@
+# backend/metrics.py
+"""
+Số liệu kiểu Prometheus cho /metrics, không cần thư viện ngoài.
+
+- Counter / Histogram có nhãn, an toàn khi dùng từ nhiều thread
+- stage("tên"): đo thời gian một bước xử lý (sinh số học, gọi LLM, render PDF...)
+- render(): xuất toàn bộ theo text exposition format 0.0.4
+
+Số liệu nằm trong bộ nhớ của từng tiến trình: chạy nhiều worker uvicorn thì
+Prometheus cần scrape từng worker. Job render trong process pool được đo từ
+phía event loop (thời gian chờ + render, số trang, số byte của kết quả).
+"""
+import io
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+NAMESPACE = "mathgen"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = f"{NAMESPACE}_{name}"
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _label_str(self, values: LabelValues, extra: str = "") -> str:
+        parts = [f'{l}="{_escape(v)}"' for l, v in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.doc}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self._samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount <= 0:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            yield f"{self.name}_total{self._label_str(key)} {_fmt(v)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # mỗi bộ nhãn: [đếm theo bucket (không cộng dồn)..., +Inf], tổng, số lần
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = len(self.buckets)
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                idx = i
+                break
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[idx] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((k, (list(c), t[0])) for k, (c, t) in self._values.items())
+        for key, (counts, total) in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="' + _fmt(bound) + '"'
+                yield f"{self.name}_bucket{self._label_str(key, le)} {acc}"
+            yield f"{self.name}_sum{self._label_str(key)} {_fmt(total)}"
+            yield f"{self.name}_count{self._label_str(key)} {acc}"
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    return "".join(m.render() for m in metrics)
+
+
+# -----------------
+# Số liệu của ứng dụng
+# -----------------
+REQUEST_LATENCY = Histogram(
+    "request_duration_seconds", "Thời gian xử lý request theo route", ("method", "route", "status")
+)
+STAGE_LATENCY = Histogram("stage_duration_seconds", "Thời gian từng bước xử lý nội bộ", ("stage",))
+LLM_CALLS = Counter("llm_calls", "Số lời gọi OpenAI theo kết quả", ("outcome",))
+WORD_FALLBACK = Counter("word_fallback_problems", "Số câu lời văn phải sinh bằng mẫu nội bộ", ("reason",))
+WORD_CACHE = Counter("word_cache_problems", "Số câu lời văn lấy từ cache (hit) / phải hỏi LLM (miss)", ("result",))
+PROBLEMS_GENERATED = Counter("problems_generated", "Số câu đã sinh", ("kind",))
+PDF_PAGES = Counter("pdf_pages", "Số trang PDF đã xuất", ("job",))
+PDF_BYTES = Counter("pdf_bytes", "Số byte PDF/ZIP đã xuất", ("job",))
+RESPONSE_CACHE = Counter("response_cache", "Tra cứu cache phản hồi theo kết quả", ("result",))
+PROFILES_DUMPED = Counter("profiles_dumped", "Số profile đã ghi cho request chậm", ("mode",))
+JOBS = Counter("jobs", "Số job nền đã kết thúc theo loại và kết quả", ("kind", "status"))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Đo thời gian một khối code (dùng được cả trong hàm async, quanh các lệnh await)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - t0, stage=name)
+
+
+def count_pdf_pages(data: bytes) -> int:
+    """Số trang trong PDF do ReportLab sinh (đối tượng /Type /Page không nén), hoặc trong các PDF của một ZIP."""
+    if data[:2] == b"PK":
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            return sum(count_pdf_pages(zf.read(n)) for n in zf.namelist() if n.endswith(".pdf"))
+    return data.count(b"/Type /Page\n") + data.count(b"/Type /Page ")
@@ -6,7 +6,8 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.utils import simpleSplit
 from pathlib import Path
-from typing import List
+import io
+from typing import BinaryIO, List, Optional, Tuple, Union
 from schema import Problem
 
 def _register_font():
@@ -24,16 +25,32 @@ def _register_font():
         print("Font register failed:", e)
     return "Helvetica"  # fallback (sẽ thiếu dấu tiếng Việt)
 
-FONT_NAME = _register_font()
+_font_name: Optional[str] = None
 
-def render_pdf(path: str, title: str, problems: List[Problem], with_answers: bool=False):
-    c = canvas.Canvas(path, pagesize=A4)
+def font_name() -> str:
+    """Đăng ký font ở lần render đầu tiên (hoặc lúc warm-up) thay vì lúc import module."""
+    global _font_name
+    if _font_name is None:
+        _font_name = _register_font()
+    return _font_name
+
+def warm_up() -> int:
+    """Đăng ký font + dựng thử một PDF nhỏ (nạp hết code ReportLab cần dùng); trả về số byte."""
+    buf = io.BytesIO()
+    render_pdf(buf, "Warm-up", [Problem(id=1, text="1 + 1 = ?", answer="2", distractors=["1", "3", "4"])], True)
+    return len(buf.getvalue())
+
+def _canvas(out: Union[str, Path, BinaryIO]) -> canvas.Canvas:
+    return canvas.Canvas(out if hasattr(out, "write") else str(out), pagesize=A4)
+
+def _draw_section(c: canvas.Canvas, title: str, problems: List[Problem], with_answers: bool):
     W, H = A4
     margin = 15 * mm
     lh = 8 * mm
     x = margin
     y = H - margin
 
+    FONT_NAME = font_name()
     c.setFont(FONT_NAME, 14)
     c.drawString(x, y, title)
     y -= 1.5 * lh
@@ -71,4 +88,20 @@ def render_pdf(path: str, title: str, problems: List[Problem], with_answers: boo
 
         y -= 0.5 * lh
 
+def render_pdf(out: Union[str, Path, BinaryIO], title: str, problems: List[Problem], with_answers: bool=False):
+    """
+    Vẽ đề ra PDF. `out` có thể là đường dẫn file hoặc bất kỳ stream nhị phân
+    nào có .write() (io.BytesIO, socket file, ...), ReportLab ghi thẳng vào đó.
+    """
+    c = _canvas(out)
+    _draw_section(c, title, problems, with_answers)
+    c.save()
+
+def render_pdf_sections(out: Union[str, Path, BinaryIO], sections: List[Tuple[str, List[Problem], bool]]):
+    """Ghép nhiều phần (title, problems, with_answers) vào một PDF, mỗi phần bắt đầu trang mới."""
+    c = _canvas(out)
+    for i, (title, problems, with_answers) in enumerate(sections):
+        if i:
+            c.showPage()
+        _draw_section(c, title, problems, with_answers)
     c.save()
@@ -0,0 +1,122 @@
+# backend/profiling.py
+"""
+Hook profile cho request chậm, bật/tắt bằng biến môi trường.
+
+- PROFILE_MODE=off (mặc định): không làm gì
+- PROFILE_MODE=cprofile: cProfile trên thread event loop, ghi file .prof (xem bằng snakeviz/pstats)
+- PROFILE_MODE=sample: luồng nền lấy mẫu stack của MỌI thread (kể cả threadpool)
+  mỗi PROFILE_SAMPLE_MS ms, ghi file .folded (định dạng collapsed của flamegraph)
+
+Mỗi lúc chỉ profile một request (các request chồng lên nhau thì bỏ qua);
+file chỉ được ghi khi request chạy lâu hơn PROFILE_SLOW_MS.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional, Union
+
+from metrics import PROFILES_DUMPED
+
+PROFILE_MODE = os.getenv("PROFILE_MODE", "off")
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 1000))
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(Path(__file__).resolve().parent / ".cache" / "profiles"))
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class _StackSampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as fh:
+            for stack, n in self.stacks.most_common():
+                fh.write(f"{stack} {n}\n")
+
+
+Session = Union[cProfile.Profile, _StackSampler]
+
+
+class RequestProfiler:
+    def __init__(
+        self,
+        mode: str = PROFILE_MODE,
+        slow_ms: float = PROFILE_SLOW_MS,
+        out_dir: str = PROFILE_DIR,
+        sample_ms: float = PROFILE_SAMPLE_MS,
+    ):
+        self.mode = mode if mode in ("cprofile", "sample") else "off"
+        self.slow_s = slow_ms / 1000
+        self.out_dir = Path(out_dir)
+        self.sample_s = sample_ms / 1000
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def start(self) -> Optional[Session]:
+        """Bắt đầu profile nếu đang bật và chưa có request nào khác đang được profile."""
+        if not self.enabled or not self._busy.acquire(blocking=False):
+            return None
+        if self.mode == "cprofile":
+            session: Session = cProfile.Profile()
+            session.enable()
+        else:
+            session = _StackSampler(self.sample_s)
+            session.start()
+        return session
+
+    def finish(self, session: Optional[Session], elapsed: float, label: str) -> Optional[Path]:
+        """Dừng profile; request chậm hơn ngưỡng thì ghi file và trả về đường dẫn."""
+        if session is None:
+            return None
+        try:
+            if isinstance(session, cProfile.Profile):
+                session.disable()
+            else:
+                session.stop()
+            if elapsed < self.slow_s:
+                return None
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}_{int(elapsed * 1000)}ms_{_UNSAFE.sub('_', label)}"
+            if isinstance(session, cProfile.Profile):
+                path = self.out_dir / f"{name}.prof"
+                session.dump_stats(str(path))
+            else:
+                path = self.out_dir / f"{name}.folded"
+                session.dump(path)
+            PROFILES_DUMPED.inc(mode=self.mode)
+            print(f"Slow request {label} ({elapsed:.2f}s), profile saved to {path}")
+            return path
+        finally:
+            self._busy.release()
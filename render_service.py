@@ -0,0 +1,197 @@
+# backend/render_service.py
+"""
+Dịch vụ render PDF chạy trong process pool riêng.
+
+ReportLab tốn CPU và giữ GIL, nên việc dựng PDF được đẩy sang các process
+con (mỗi process đăng ký font một lần khi khởi động). Số job đang chạy +
+đang chờ bị giới hạn; đầy thì báo RenderBusy để route trả 503 "thử lại sau",
+job quá PDF_JOB_TIMEOUT giây thì báo RenderTimeout.
+"""
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+
+from schema import Problem
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", max(1, (os.cpu_count() or 2) - 1)))  # 0 = render trong threadpool
+PDF_QUEUE_SIZE = int(os.getenv("PDF_QUEUE_SIZE", 16))      # số job được xếp hàng thêm ngoài số worker
+PDF_JOB_TIMEOUT = float(os.getenv("PDF_JOB_TIMEOUT", 60))
+PDF_MP_CONTEXT = os.getenv("PDF_MP_CONTEXT", "spawn")      # tránh fork khi tiến trình chính đã có nhiều thread
+
+QUESTIONS_TITLE = "BÀI TẬP TOÁN - CÂU HỎI"
+ANSWERS_TITLE = "BÀI TẬP TOÁN - ĐÁP ÁN"
+
+
+class RenderBusy(RuntimeError):
+    pass
+
+
+class RenderTimeout(RuntimeError):
+    pass
+
+
+# ---- chạy trong process con ----
+def _init_worker() -> None:
+    import pdf
+    pdf.font_name()  # đăng ký font một lần mỗi process
+
+
+def warm_up_job() -> int:
+    from pdf import warm_up
+    return warm_up()
+
+
+def render_pdf_bytes(title: str, problems: List[Problem], with_answers: bool) -> bytes:
+    from pdf import render_pdf
+    buf = io.BytesIO()
+    render_pdf(buf, title, problems, with_answers=with_answers)
+    return buf.getvalue()
+
+
+def render_bundle_bytes(problems: List[Problem], fmt: str) -> Tuple[bytes, str, str]:
+    """
+    Đề + đáp án dựng từ CÙNG một danh sách câu hỏi, trả (data, media_type, filename):
+    - fmt="zip": 2 file PDF riêng trong một ZIP
+    - fmt="pdf": một PDF, phần đáp án nối ngay sau phần câu hỏi
+    """
+    from pdf import render_pdf, render_pdf_sections
+    buf = io.BytesIO()
+    if fmt == "pdf":
+        render_pdf_sections(buf, [
+            (QUESTIONS_TITLE, problems, False),
+            (ANSWERS_TITLE, problems, True),
+        ])
+        return buf.getvalue(), "application/pdf", "worksheet.pdf"
+
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, title, with_answers in (
+            ("worksheet_questions.pdf", QUESTIONS_TITLE, False),
+            ("worksheet_answers.pdf", ANSWERS_TITLE, True),
+        ):
+            with zf.open(name, "w") as fh:
+                render_pdf(fh, title, problems, with_answers=with_answers)
+    return buf.getvalue(), "application/zip", "worksheet.zip"
+
+
+Variant = Tuple[int, List[Problem]]  # (số thứ tự đề, danh sách câu)
+
+
+def _variant_title(title: str, idx: int) -> str:
+    return f"{title} - ĐỀ {idx}"
+
+
+def render_variants_bytes(variants: List[Variant]) -> List[Tuple[int, bytes, bytes]]:
+    """Render một nhóm biến thể trong cùng process: (idx, PDF câu hỏi, PDF đáp án)."""
+    return [
+        (
+            idx,
+            render_pdf_bytes(_variant_title(QUESTIONS_TITLE, idx), problems, False),
+            render_pdf_bytes(_variant_title(ANSWERS_TITLE, idx), problems, True),
+        )
+        for idx, problems in variants
+    ]
+
+
+def render_answer_key_bytes(variants: List[Variant]) -> bytes:
+    """Đáp án gộp cho cả bộ đề, mỗi biến thể một phần."""
+    from pdf import render_pdf_sections
+    buf = io.BytesIO()
+    render_pdf_sections(buf, [(_variant_title(ANSWERS_TITLE, i), p, True) for i, p in variants])
+    return buf.getvalue()
+
+
+def render_class_set_pdf(variants: List[Variant]) -> bytes:
+    """Một PDF duy nhất: tất cả đề câu hỏi, sau đó đáp án gộp."""
+    from pdf import render_pdf_sections
+    buf = io.BytesIO()
+    render_pdf_sections(
+        buf,
+        [(_variant_title(QUESTIONS_TITLE, i), p, False) for i, p in variants]
+        + [(_variant_title(ANSWERS_TITLE, i), p, True) for i, p in variants],
+    )
+    return buf.getvalue()
+
+
+def build_class_set_zip(
+    rendered: List[Tuple[int, bytes, bytes]], answer_key: bytes, manifest: dict
+) -> bytes:
+    # PDF đã nén sẵn nên chỉ lưu (ZIP_STORED), không tốn CPU nén lại
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for idx, questions, answers in sorted(rendered):
+            zf.writestr(f"de_{idx:02d}_cau_hoi.pdf", questions)
+            zf.writestr(f"de_{idx:02d}_dap_an.pdf", answers)
+        zf.writestr("dap_an_tong_hop.pdf", answer_key)
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    return buf.getvalue()
+
+
+# ---- phía event loop ----
+class RenderService:
+    def __init__(
+        self,
+        workers: int = PDF_WORKERS,
+        queue_size: int = PDF_QUEUE_SIZE,
+        timeout: float = PDF_JOB_TIMEOUT,
+    ):
+        self.workers = workers
+        self.capacity = max(1, workers) + queue_size
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight = 0  # chỉ đổi trên event loop nên không cần khoá
+
+    def _executor(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None  # executor mặc định (threadpool) của event loop
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(PDF_MP_CONTEXT),
+                initializer=_init_worker,
+            )
+        return self._pool
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def _release(self, _fut) -> None:
+        self._inflight -= 1
+
+    async def run(self, fn: Callable, *args):
+        """Chạy fn(*args) trong pool; đầy hàng đợi -> RenderBusy, quá hạn -> RenderTimeout."""
+        if self._inflight >= self.capacity:
+            raise RenderBusy("Máy chủ đang bận xuất PDF, vui lòng thử lại sau")
+        self._inflight += 1
+        loop = asyncio.get_running_loop()
+        try:
+            fut = loop.run_in_executor(self._executor(), fn, *args)
+        except BaseException:
+            self._inflight -= 1
+            raise
+        # giữ chỗ tới khi job thật sự xong (process con không huỷ giữa chừng được)
+        fut.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+        except asyncio.TimeoutError:
+            raise RenderTimeout("Xuất PDF quá thời gian cho phép")
+        except BrokenProcessPool:
+            self._pool = None  # process con chết bất thường: lần sau tạo pool mới
+            raise
+
+    async def warm_up(self) -> int:
+        """Khởi động đủ số process con (gửi đồng thời mỗi process một job) và render thử một PDF nhỏ."""
+        n = max(1, self.workers)
+        await asyncio.gather(*(self.run(warm_up_job) for _ in range(n)))
+        return n
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,176 @@
+# backend/response_cache.py
+"""
+Cache phản hồi cho các request tất định (có seed, không gọi LLM).
+
+Khoá là sha256 của (route, tham số, cấu hình đã chuẩn hoá, phiên bản). Tầng 1
+là LRU trong bộ nhớ giới hạn theo tổng số byte; tầng 2 (tuỳ chọn) là SQLite
+cục bộ. ETag suy ra từ chính khoá (weak ETag: PDF render lại có thể khác vài
+byte metadata nhưng nội dung như nhau), nên If-None-Match khớp là trả 304
+ngay cả khi phản hồi đã bị đẩy khỏi cache.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from pydantic import BaseModel
+
+# Tăng khi thay đổi cách sinh đề/render làm kết quả của cùng cấu hình khác đi
+RESPONSE_CACHE_VERSION = 3
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    filename: Optional[str] = None
+
+
+def request_key(route: str, cfg: BaseModel, **params) -> str:
+    raw = json.dumps(
+        {"v": RESPONSE_CACHE_VERSION, "route": route, "cfg": cfg.model_dump(mode="json"), "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def etag_for(key: str) -> str:
+    return f'W/"{key[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    So khớp If-None-Match kiểu weak (bỏ tiền tố W/), hỗ trợ danh sách tag.
+    Bỏ qua '*': các route cache là POST, '*' không chứng minh client đã có
+    đúng nội dung này nên không được trả 304.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag != "*" and (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 8 * 1024 * 1024,
+        path: Optional[Path] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._mem_bytes = 0
+
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, media_type TEXT NOT NULL, filename TEXT,"
+                    " body BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS ix_responses_used ON responses(used)")
+                self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            except sqlite3.Error as e:
+                print("Response cache disk store disabled:", e)
+                self._db = None
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        raw_path = os.getenv("RESPONSE_CACHE_PATH", "")  # mặc định chỉ dùng RAM
+        return cls(
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            max_entry_bytes=int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", 8 * 1024 * 1024)),
+            path=Path(raw_path) if raw_path else None,
+            disk_max_bytes=int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024)),
+        )
+
+    @property
+    def has_disk(self) -> bool:
+        return self._db is not None
+
+    # ---- tầng bộ nhớ ----
+    def get_memory(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                self._mem.move_to_end(key)
+            return hit
+
+    def _put_memory(self, key: str, resp: CachedResponse) -> None:
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_bytes -= len(old.body)
+            self._mem[key] = resp
+            self._mem_bytes += len(resp.body)
+            while self._mem_bytes > self.max_bytes and self._mem:
+                _, evicted = self._mem.popitem(last=False)
+                self._mem_bytes -= len(evicted.body)
+
+    # ---- tầng đĩa (I/O chặn: gọi từ threadpool) ----
+    def get_disk(self, key: str) -> Optional[CachedResponse]:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT body, media_type, filename FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+        resp = CachedResponse(bytes(row[0]), row[1], row[2])
+        self._put_memory(key, resp)
+        return resp
+
+    def _put_disk(self, key: str, resp: CachedResponse) -> None:
+        size = len(resp.body)
+        with self._db_lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses(key, media_type, filename, body, size, used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, resp.media_type, resp.filename, resp.body, size, time.time()),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            while self._disk_bytes > self.disk_max_bytes:
+                victim = self._db.execute(
+                    "SELECT key, size FROM responses WHERE key != ? ORDER BY used LIMIT 1", (key,)
+                ).fetchone()
+                if victim is None:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (victim[0],))
+                self._disk_bytes -= victim[1]
+            self._db.execute("COMMIT")
+
+    def put(self, key: str, resp: CachedResponse) -> None:
+        """Lưu vào RAM và (nếu bật) SQLite; phản hồi quá max_entry_bytes thì không cache."""
+        if len(resp.body) > self.max_entry_bytes:
+            return
+        self._put_memory(key, resp)
+        if self._db is not None:
+            try:
+                self._put_disk(key, resp)
+            except sqlite3.Error as e:
+                print("Response cache write failed:", e)
@@ -1,20 +1,29 @@
-from typing import List, Optional, Literal, Dict
+from dataclasses import dataclass, field
+from typing import List, Optional, Literal, Dict, Tuple, Union
 from pydantic import BaseModel, Field, model_validator
 
 Operation = Literal["+", "-", "×", "÷"]
 Mode = Literal["easy_to_hard", "balanced", "hard_to_easy"] 
+Bucket = Literal["easy", "medium", "hard"]
+# Toán hạng được sinh bằng mảng int64: giới hạn để tích hi * hi (nhân, số bị chia)
+# và đáp án nhiễu (± vài đơn vị) vẫn nằm trong int64
+MAX_OPERAND = 3_000_000_000
 class GenerationConfig(BaseModel):
     grade: int = Field(ge=1, le=5)
     operations: List[Operation]
     count: int = Field(ge=1, le=200)
     mcq_count: Optional[int] = None     
     word_count: Optional[int] = None   
-    min_value: int = Field(ge=0)
-    max_value: int = Field(ge=1)
+    min_value: int = Field(ge=0, le=MAX_OPERAND)
+    max_value: int = Field(ge=1, le=MAX_OPERAND)
     include_word_problems: bool = False
     include_distractors: bool = True
     seed: Optional[int] = None
     language: Literal["vi", "en"] = "vi"
+    unique: bool = False  # không lặp bài (3 + 4 và 4 + 3 tính là một)
+    # Độ khó mục tiêu cho câu số học (sinh thẳng vào bucket, không cần sinh dư rồi lọc):
+    difficulty_mix: Optional[Dict[Bucket, float]] = None     # tỉ lệ, vd. {"easy": 1, "medium": 1, "hard": 1}
+    difficulty_range: Optional[Tuple[float, float]] = None   # chỉ lấy câu có độ khó trong [min, max]
 
 
     @model_validator(mode="after")
@@ -25,9 +34,35 @@ class GenerationConfig(BaseModel):
             raise ValueError("word_count must be <= count")
         if mcq > self.count - wc:
             raise ValueError("mcq_count must be <= count - word_count")
+        if self.difficulty_mix is not None:
+            if any(w < 0 for w in self.difficulty_mix.values()) or sum(self.difficulty_mix.values()) <= 0:
+                raise ValueError("difficulty_mix weights must be >= 0 with a positive sum")
+        if self.difficulty_range is not None:
+            lo, hi = self.difficulty_range
+            if not 0.0 <= lo <= hi <= 1.0:
+                raise ValueError("difficulty_range must satisfy 0 <= min <= max <= 1")
+        if self.unique and (self.difficulty_mix is not None or self.difficulty_range is not None):
+            raise ValueError("unique cannot be combined with difficulty_mix/difficulty_range")
         return self
 
 
+STREAM_MAX_COUNT = 100_000
+
+class StreamGenerationConfig(GenerationConfig):
+    """Cấu hình cho /api/generate/stream – cho phép bộ đề rất lớn."""
+    count: int = Field(ge=1, le=STREAM_MAX_COUNT)
+
+
+CLASS_SET_MAX_VARIANTS = 60
+
+class ClassSetRequest(BaseModel):
+    """Xuất một bộ đề cho cả lớp: mỗi học sinh một biến thể từ cùng cấu hình."""
+    config: GenerationConfig
+    variants: int = Field(ge=1, le=CLASS_SET_MAX_VARIANTS)
+    base_seed: Optional[int] = None
+    format: Literal["zip", "pdf"] = "zip"
+
+
 class Problem(BaseModel):
     id: int
     text: str
@@ -37,6 +72,25 @@ class Problem(BaseModel):
     difficulty: float = 0.0
     source: Optional[str] = None
 
+
+@dataclass(slots=True)
+class ProblemRecord:
+    """
+    Bản gọn của Problem cho các đường xử lý hàng loạt (sinh đề, ghép đề, upload,
+    ngân hàng đề): không validate, không có __dict__, orjson serialize trực tiếp.
+    Cùng tên trường với Problem nên pdf/score_batch/bank dùng được cả hai.
+    """
+    id: int
+    text: str
+    answer: str
+    distractors: List[str] = field(default_factory=list)
+    kind: str = "arithmetic"
+    difficulty: float = 0.0
+    source: Optional[str] = None
+
+
+ProblemLike = Union[Problem, ProblemRecord]
+
 class AssembleRequest(BaseModel):
     pool: List[Problem]
     total_count: int = 20
@@ -44,9 +98,55 @@ class AssembleRequest(BaseModel):
     word_count: int = 0
     mode: Literal["easy_to_hard", "balanced", "hard_to_easy"] = "easy_to_hard"
 
+class BankAssembleRequest(BaseModel):
+    bank_id: str
+    total_count: int = 20
+    mcq_count: int = 10
+    word_count: int = 0
+    mode: Literal["easy_to_hard", "balanced", "hard_to_easy"] = "easy_to_hard"
+    operations: Optional[List[Operation]] = None  # lọc theo phép tính
+    sources: Optional[List[str]] = None           # lọc theo nguồn: "uploaded", "generated", ...
+
+class BankInfo(BaseModel):
+    bank_id: str
+    name: Optional[str] = None
+    created: float
+    count: int
+    by_kind: Dict[str, int]
+
+class Score(BaseModel):
+    id: int
+    difficulty: float
+    operation: Optional[Operation] = None
+    bucket: Literal["easy", "medium", "hard"]
+
 class Evaluation(BaseModel):
     avg_difficulty: float
     buckets: Dict[str, int]
     by_kind: Dict[str, int]
     by_op: Dict[str, int]
     notes: List[str] = []
+
+class EvaluationSession(BaseModel):
+    """Trạng thái phiên đánh giá tăng dần: số câu hiện có và đánh giá mới nhất."""
+    session_id: str
+    count: int
+    evaluation: Evaluation
+
+JobStatus = Literal["queued", "running", "done", "failed", "cancelled"]
+
+class JobInfo(BaseModel):
+    """Trạng thái một job xuất file chạy nền."""
+    job_id: str
+    kind: str
+    status: JobStatus
+    progress: float = 0.0            # 0..1
+    stage: Optional[str] = None      # bước đang chạy: generate, render, ...
+    error: Optional[str] = None
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    expires: float                   # sau thời điểm này job và file kết quả bị xoá
+    filename: Optional[str] = None
+    size: Optional[int] = None
+    download_url: Optional[str] = None
@@ -0,0 +1,49 @@
+# backend/serialization.py
+"""
+Mã hoá JSON nhanh cho phản hồi lớn (danh sách đề, NDJSON/SSE, cache phản hồi).
+
+Dùng orjson nếu có: serialize thẳng ProblemRecord (dataclass slots) và mảng
+numpy mà không qua model pydantic. Không cài orjson thì rơi về json chuẩn
+(chậm hơn nhưng cho cùng kết quả: UTF-8, không khoảng trắng).
+"""
+import dataclasses
+import json
+from typing import Any, Iterable
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    if hasattr(obj, "tolist"):  # số / mảng numpy
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_lines(items: Iterable[Any]) -> bytes:
+    """NDJSON: mỗi phần tử một dòng."""
+    return b"".join(dumps(x) + b"\n" for x in items)
+
+
+def dumps_events(items: Iterable[Any], event: str) -> bytes:
+    """Server-Sent Events: mỗi phần tử một event `event`."""
+    head = f"event: {event}\ndata: ".encode("utf-8")
+    return b"".join(head + dumps(x) + b"\n\n" for x in items)
@@ -0,0 +1,190 @@
+# backend/test_generator.py
+"""
+Kiểm tra tính chất của generator (chạy: python -m pytest -q):
+- difficulty_mix cho đúng số câu mỗi bucket, difficulty_range giữ mọi câu trong đoạn
+- unique không lặp bài (3 + 4 và 4 + 3 tính là một)
+- score_batch chấm trùng khớp score_problem, ExamTally đánh giá như evaluate_exam
+- cấu hình không đạt được thì báo lỗi ngay thay vì sinh thiếu/lặp
+"""
+import random
+
+import pytest
+
+from schema import MAX_OPERAND, GenerationConfig, ProblemRecord
+from generator import (
+    DifficultyUnreachable,
+    ExamTally,
+    ProblemSpaceExhausted,
+    _largest_remainder,
+    _tag,
+    check_difficulty_target,
+    evaluate_exam,
+    generate_arithmetic,
+    iter_arithmetic,
+    problem_space_size,
+    score_batch,
+    score_problem,
+)
+
+SEEDS = range(5)
+
+
+def _cfg(**kw) -> GenerationConfig:
+    base = dict(grade=3, operations=["+", "-", "×", "÷"], count=60, min_value=0, max_value=100, seed=0)
+    base.update(kw)
+    return GenerationConfig(**base)
+
+
+def _key(text: str):
+    """Khoá chuẩn hoá: cộng/nhân giao hoán nên sắp xếp hai toán hạng."""
+    a, op, b = text.split()[:3]
+    if op in ("+", "×"):
+        a, b = sorted((int(a), int(b)))
+    return op, int(a), int(b)
+
+
+# -----------------
+# Độ khó mục tiêu
+# -----------------
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize(
+    "mix",
+    [{"easy": 1, "medium": 1, "hard": 1}, {"easy": 3, "hard": 1}, {"medium": 1}, {"easy": 0.2, "medium": 0.5, "hard": 0.3}],
+)
+def test_difficulty_mix_exact_bucket_counts(seed, mix):
+    cfg = _cfg(count=47, seed=seed, difficulty_mix=mix)
+    problems = generate_arithmetic(cfg)
+    assert len(problems) == cfg.count
+
+    names = ("easy", "medium", "hard")
+    expected = dict(zip(names, _largest_remainder(cfg.count, [mix.get(n, 0.0) for n in names])))
+    # chấm lại từ đề (như evaluate_exam), không tin độ khó ghi sẵn trong bản ghi
+    got = {n: 0 for n in names}
+    for b in score_batch(problems).bucket:
+        got[b] += 1
+    assert got == expected
+    assert [_tag(p.difficulty) for p in problems] == score_batch(problems).bucket
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("bounds", [(0.3, 0.5), (0.6, 0.6), (0.0, 0.34), (0.67, 1.0)])
+def test_difficulty_range_bounds(seed, bounds):
+    lo, hi = bounds
+    cfg = _cfg(count=80, seed=seed, difficulty_range=bounds)
+    problems = generate_arithmetic(cfg)
+    assert len(problems) == cfg.count
+    for d in score_batch(problems).difficulty.tolist():
+        assert lo - 1e-9 <= d <= hi + 1e-9
+
+
+def test_difficulty_mix_streams_match_full_batch():
+    cfg = _cfg(count=120, difficulty_mix={"easy": 1, "hard": 2})
+    streamed = [p for batch in iter_arithmetic(cfg, batch_size=25) for p in batch]
+    assert [p.id for p in streamed] == list(range(1, cfg.count + 1))
+    assert sorted(score_batch(streamed).bucket) == sorted(score_batch(generate_arithmetic(cfg)).bucket)
+
+
+def test_difficulty_unreachable_fails_fast():
+    # phép cộng với toán hạng nhỏ không bao giờ "hard"
+    cfg = _cfg(operations=["+"], max_value=10, difficulty_mix={"easy": 1, "hard": 1})
+    with pytest.raises(DifficultyUnreachable):
+        check_difficulty_target(cfg, cfg.count)
+    with pytest.raises(DifficultyUnreachable):
+        generate_arithmetic(cfg)
+
+
+# -----------------
+# Không trùng lặp
+# -----------------
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("ops", [["+"], ["×"], ["+", "-", "×", "÷"]])
+def test_unique_has_no_commutative_duplicates(seed, ops):
+    cfg = _cfg(operations=ops, max_value=30, seed=seed, unique=True)
+    # sát giới hạn không gian (phép nhân dùng toán hạng nhỏ hơn theo lớp)
+    cfg = cfg.model_copy(update={"count": min(200, problem_space_size(cfg))})
+    problems = generate_arithmetic(cfg)
+    keys = [_key(p.text) for p in problems]
+    assert len(keys) == cfg.count
+    assert len(set(keys)) == len(keys)
+
+
+def test_unique_can_use_whole_problem_space():
+    # 0..4 với phép cộng: đúng 15 cặp không thứ tự
+    cfg = _cfg(operations=["+"], count=15, min_value=0, max_value=4, unique=True)
+    assert problem_space_size(cfg) == 15
+    keys = {_key(p.text) for p in generate_arithmetic(cfg)}
+    assert keys == {("+", a, b) for a in range(5) for b in range(a, 5)}
+
+
+def test_unique_count_over_problem_space_fails_fast():
+    cfg = _cfg(operations=["+"], count=16, min_value=0, max_value=4, unique=True)
+    assert cfg.count > problem_space_size(cfg)
+    with pytest.raises(ProblemSpaceExhausted):
+        generate_arithmetic(cfg)
+
+
+# -----------------
+# Chấm & đánh giá
+# -----------------
+_WORDS = [
+    "Lan có 12 quả táo, mẹ cho thêm 7 quả. Hỏi Lan có bao nhiêu quả táo?",
+    "Mỗi hộp có 6 cái bút. Nhân với 4 hộp thì được bao nhiêu cái bút?",
+    "Chia đều 48 cái kẹo cho 8 bạn, mỗi bạn được mấy cái?",
+    "Tom has 3 boxes with 9 pens each. Multiply to find how many pens.",
+    "Divide 20 ÷ 5 apples among friends.",
+    "Một bài không có số nào cả",
+    "x" * 2000,  # đề rất dài: điểm bị chặn ở 1.0
+]
+_ARITHS = [
+    "3 + 4 = ?", "90 - 45 = ?", "12 × 11 = ?", "81 ÷ 9 = ?", "0 + 0 = ?",
+    "199 + 1 = ?", "3000000000 × 3000000000 = ?",
+    # toán hạng vượt int64 / vượt _OPERAND_CAP
+    "123456789012345678901234567890 + 5 = ?", "7 - 99999999999999999999999 = ?",
+    "Tính nhẩm giúp mình", "2 + ? = 9",
+]
+
+
+def test_score_batch_matches_score_problem():
+    problems = [ProblemRecord(i, t, "0") for i, t in enumerate(_ARITHS, start=1)]
+    problems += [ProblemRecord(100 + i, t, "0", kind="word") for i, t in enumerate(_WORDS)]
+    problems += generate_arithmetic(_cfg(count=200, max_value=MAX_OPERAND))
+    scored = score_batch(problems)
+    assert scored.difficulty.tolist() == [score_problem(p) for p in problems]
+    assert scored.bucket == [_tag(score_problem(p)) for p in problems]
+
+
+def test_score_batch_empty():
+    scored = score_batch([])
+    assert scored.difficulty.tolist() == [] and scored.operation == [] and scored.bucket == []
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_exam_tally_matches_evaluate_exam(seed):
+    rnd = random.Random(seed)
+    cfg = _cfg(count=150, max_value=500, seed=seed, include_word_problems=True)
+    pool = generate_arithmetic(cfg)
+    pool += [
+        ProblemRecord(1000 + i, t, "0", kind="word", difficulty=score_problem(ProblemRecord(0, t, "0", kind="word")))
+        for i, t in enumerate(_WORDS)
+    ]
+    # sửa câu: cùng id, nội dung/độ khó khác
+    pool += [ProblemRecord(p.id, p.text.replace("+", "×"), p.answer, difficulty=rnd.random()) for p in pool[:20]]
+
+    tally, current = ExamTally(pool[:30]), {p.id: p for p in pool[:30]}
+    assert tally.evaluation() == evaluate_exam(list(current.values()))
+    for _ in range(400):
+        if current and rnd.random() < 0.4:
+            pid = rnd.choice(list(current))
+            assert tally.remove(pid)
+            del current[pid]
+        else:
+            p = rnd.choice(pool)
+            tally.put(p)
+            current[p.id] = p
+        assert len(tally) == len(current)
+        assert tally.evaluation() == evaluate_exam(list(current.values()))
+    assert not tally.remove(-1)
+
+    for pid in list(current):
+        tally.remove(pid)
+    assert tally.evaluation() == evaluate_exam([])
@@ -0,0 +1,133 @@
+# backend/upload.py
+"""
+Parser .txt/.csv dạng stream cho /api/upload.
+
+File được đọc theo từng khúc và giải mã UTF-8 tăng dần (TextIOWrapper),
+ký tự phân tách được đoán từ vài dòng đầu, mỗi dòng sinh ra một ProblemRecord
+và được chấm theo lô. Không giữ thêm bản sao nào của toàn bộ file.
+"""
+import csv
+import io
+import os
+import re
+from itertools import chain, islice
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from schema import ProblemLike, ProblemRecord
+from generator import score_batch
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+UPLOAD_MAX_ROWS = int(os.getenv("UPLOAD_MAX_ROWS", 100_000))
+READ_CHUNK_SIZE = 64 * 1024
+SAMPLE_LINES = 64
+SCORE_BATCH_SIZE = 1000
+
+_ANSWER_SPLIT = re.compile(r"đáp án[:：]|answer[:：]", re.I)
+_OP_RE = re.compile(r"[+\-×÷]")
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def _format_size(n: int) -> str:
+    """Kích thước dễ đọc cho thông báo lỗi: MB, KB hoặc byte (giới hạn nhỏ không hiện "0 MB")."""
+    for unit, size in (("MB", 1024 * 1024), ("KB", 1024)):
+        if n >= size:
+            return f"{n / size:.4g} {unit}"
+    return f"{n} byte"
+
+
+class _LimitedReader(io.RawIOBase):
+    """Bọc file upload: đọc tối đa `limit` byte, vượt quá thì báo lỗi ngay."""
+
+    def __init__(self, raw: BinaryIO, limit: int):
+        self._raw = raw
+        self._left = limit
+        self._limit = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._raw.read(len(b))
+        self._left -= len(data)
+        if self._left < 0:
+            raise UploadTooLarge(f"File quá lớn (tối đa {_format_size(self._limit)})")
+        b[:len(data)] = data
+        return len(data)
+
+
+def sniff_delimiter(sample: List[str]) -> Optional[str]:
+    """'|' nếu mẫu có '|', ngược lại ',' nếu có ',', không có thì None (dạng '... đáp án: ...')."""
+    if any("|" in l for l in sample):
+        return "|"
+    if any("," in l for l in sample):
+        return ","
+    return None
+
+
+def _split_answer(line: str) -> Tuple[str, str]:
+    m = _ANSWER_SPLIT.split(line)
+    return m[0].strip(), (m[1].strip() if len(m) > 1 else "")
+
+
+def _csv_pair(row: List[str]) -> Tuple[str, str]:
+    if len(row) == 1 and "," in row[0]:  # file trộn '|' và ',': tách nhanh, không cần reader thứ hai
+        row = row[0].split(",")
+    return row[0].strip(), (row[1].strip() if len(row) > 1 else "")
+
+
+def iter_problems(lines: Iterable[str], max_rows: int = UPLOAD_MAX_ROWS) -> Iterator[ProblemRecord]:
+    """
+    Parse dần từng dòng:
+    - Hỗ trợ phân tách bằng '|' hoặc ',' hoặc '... đáp án: ...'
+    """
+    it = (s for s in (l.strip() for l in lines) if s)
+    sample = list(islice(it, SAMPLE_LINES))
+    delim = sniff_delimiter(sample)
+    lines_all = chain(sample, it)
+
+    if delim:
+        rows = (_csv_pair(row) for row in csv.reader(lines_all, delimiter=delim) if row)
+    else:
+        rows = (_split_answer(l) for l in lines_all)
+
+    for i, (q, a) in enumerate(rows, start=1):
+        if i > max_rows:
+            raise UploadTooLarge(f"Quá nhiều dòng (tối đa {max_rows})")
+        kind = "arithmetic" if _OP_RE.search(q) else "word"
+        yield ProblemRecord(i, q, a, [], kind, 0.0, "uploaded")
+
+
+def score_in_batches(
+    problems: Iterable[ProblemLike], batch_size: int = SCORE_BATCH_SIZE
+) -> List[ProblemLike]:
+    out: List[ProblemLike] = []
+    it = iter(problems)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return out
+        for p, d in zip(batch, score_batch(batch).difficulty.tolist()):
+            p.difficulty = d
+        out.extend(batch)
+
+
+def parse_upload(
+    raw: BinaryIO,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    max_rows: int = UPLOAD_MAX_ROWS,
+) -> List[ProblemRecord]:
+    """Đọc file nhị phân (vd. UploadFile.file) theo khúc, trả về các bản ghi đã chấm điểm."""
+    text = io.TextIOWrapper(
+        io.BufferedReader(_LimitedReader(raw, max_bytes), READ_CHUNK_SIZE),
+        encoding="utf-8",
+        errors="ignore",
+    )
+    return score_in_batches(iter_problems(text, max_rows))
+
+
+def parse_text(data: str, max_rows: int = UPLOAD_MAX_ROWS) -> List[ProblemRecord]:
+    """Như parse_upload nhưng cho nội dung đã có sẵn dạng chuỗi (chưa chấm điểm)."""
+    return list(iter_problems(data.splitlines(), max_rows))
@@ -0,0 +1,203 @@
+# backend/word_cache.py
+"""
+Cache bài toán lời văn theo nội dung prompt.
+
+Mỗi khoá (băm từ i18n.prompt_params) giữ một "pool" các cặp (text, answer)
+đã kiểm tra hợp lệ. Tầng 1 là LRU trong bộ nhớ, tầng 2 là SQLite cục bộ.
+Phần tử quá TTL bị bỏ, pool/DB vượt kích thước thì xoá phần tử cũ nhất,
+pool xuống dưới ngưỡng thì được bổ sung ngầm bằng một lời gọi LLM.
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from schema import GenerationConfig
+from i18n import prompt_params
+
+Pair = Tuple[str, str]
+_Entry = Tuple[str, str, float]  # (text, answer, created_at)
+
+_DEFAULT_PATH = Path(__file__).resolve().parent / ".cache" / "word_problems.sqlite3"
+
+
+def cache_key(cfg: GenerationConfig) -> str:
+    raw = json.dumps(prompt_params(cfg), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def validate_pairs(items: Iterable[Pair]) -> List[Pair]:
+    """Giữ các cặp có đề không rỗng, không trùng và đáp án là số."""
+    out: List[Pair] = []
+    seen: Set[str] = set()
+    for text, ans in items:
+        text, ans = str(text).strip(), str(ans).strip()
+        if not text or text in seen:
+            continue
+        try:
+            float(ans.replace(",", "."))
+        except ValueError:
+            continue
+        seen.add(text)
+        out.append((text, ans))
+    return out
+
+
+class WordProblemCache:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl: float = 7 * 86400,
+        pool_size: int = 120,
+        low_water: int = 40,
+        mem_keys: int = 256,
+        disk_max_rows: int = 100_000,
+    ):
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self.low_water = low_water
+        self.mem_keys = mem_keys
+        self.disk_max_rows = disk_max_rows
+
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, List[_Entry]]" = OrderedDict()
+        self._pending: Set[str] = set()
+        self._writes = 0
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="word-cache")
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS word_cache ("
+                    " key TEXT NOT NULL, text TEXT NOT NULL, answer TEXT NOT NULL,"
+                    " created REAL NOT NULL, PRIMARY KEY (key, text))"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS ix_word_cache_created ON word_cache(created)")
+            except sqlite3.Error as e:
+                print("Word cache disk store disabled:", e)
+                self._db = None
+
+    @classmethod
+    def from_env(cls) -> "WordProblemCache":
+        raw_path = os.getenv("WORD_CACHE_PATH", str(_DEFAULT_PATH))
+        return cls(
+            path=Path(raw_path) if raw_path else None,  # WORD_CACHE_PATH="" -> chỉ dùng RAM
+            ttl=float(os.getenv("WORD_CACHE_TTL", 7 * 86400)),
+            pool_size=int(os.getenv("WORD_CACHE_POOL_SIZE", 120)),
+            low_water=int(os.getenv("WORD_CACHE_LOW_WATER", 40)),
+            mem_keys=int(os.getenv("WORD_CACHE_MEM_KEYS", 256)),
+            disk_max_rows=int(os.getenv("WORD_CACHE_DISK_MAX_ROWS", 100_000)),
+        )
+
+    # ---- nội bộ (gọi khi đang giữ self._lock) ----
+    def _read_disk(self, key: str) -> List[_Entry]:
+        if self._db is None:
+            return []
+        cutoff = time.time() - self.ttl
+        self._db.execute("DELETE FROM word_cache WHERE key = ? AND created < ?", (key, cutoff))
+        rows = self._db.execute(
+            "SELECT text, answer, created FROM word_cache WHERE key = ? ORDER BY created",
+            (key,),
+        ).fetchall()
+        return [(t, a, c) for t, a, c in rows]
+
+    def _pool(self, key: str) -> List[_Entry]:
+        pool = self._mem.get(key)
+        if pool is None:
+            pool = self._read_disk(key)
+            self._mem[key] = pool
+            while len(self._mem) > self.mem_keys:
+                self._mem.popitem(last=False)
+        else:
+            self._mem.move_to_end(key)
+        cutoff = time.time() - self.ttl
+        if pool and pool[0][2] < cutoff:  # pool luôn xếp theo created tăng dần
+            pool[:] = [e for e in pool if e[2] >= cutoff]
+        return pool
+
+    # ---- API ----
+    def size(self, key: str) -> int:
+        with self._lock:
+            return len(self._pool(key))
+
+    def take(self, key: str, n: int, rng: Optional[random.Random] = None) -> List[Pair]:
+        """Lấy ngẫu nhiên tối đa n cặp khác nhau từ pool (không lấy ra khỏi pool)."""
+        rng = rng or random
+        with self._lock:
+            pool = self._pool(key)
+            picked = rng.sample(pool, min(n, len(pool)))
+        return [(t, a) for t, a, _ in picked]
+
+    def add(self, key: str, pairs: Iterable[Pair]) -> None:
+        now = time.time()
+        with self._lock:
+            pool = self._pool(key)
+            have = {t for t, _, _ in pool}
+            new = [(t, a, now) for t, a in pairs if t not in have]
+            if not new:
+                return
+            pool.extend(new)
+            evicted = pool[: max(0, len(pool) - self.pool_size)]
+            del pool[: len(evicted)]
+
+            if self._db is None:
+                return
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO word_cache(key, text, answer, created) VALUES (?, ?, ?, ?)",
+                [(key, t, a, c) for t, a, c in new],
+            )
+            if evicted:
+                self._db.executemany(
+                    "DELETE FROM word_cache WHERE key = ? AND text = ?",
+                    [(key, t) for t, _, _ in evicted],
+                )
+            self._db.execute("COMMIT")
+
+            self._writes += 1
+            if self._writes % 50 == 0:
+                self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        # giới hạn tổng số dòng trên đĩa: xoá dòng cũ nhất trước
+        assert self._db is not None
+        self._db.execute("DELETE FROM word_cache WHERE created < ?", (time.time() - self.ttl,))
+        (total,) = self._db.execute("SELECT COUNT(*) FROM word_cache").fetchone()
+        if total > self.disk_max_rows:
+            self._db.execute(
+                "DELETE FROM word_cache WHERE rowid IN ("
+                " SELECT rowid FROM word_cache ORDER BY created LIMIT ?)",
+                (total - self.disk_max_rows,),
+            )
+            self._mem.clear()  # RAM có thể đang giữ dòng vừa bị xoá
+
+    def maybe_topup(self, key: str, fetch: Callable[[int], List[Pair]]) -> None:
+        """Nếu pool dưới ngưỡng, gọi fetch(k) ở luồng nền để bổ sung tới pool_size."""
+        with self._lock:
+            size = len(self._pool(key))
+            if size >= self.low_water or key in self._pending:
+                return
+            self._pending.add(key)
+        want = self.pool_size - size
+
+        def run():
+            try:
+                self.add(key, validate_pairs(fetch(want)))
+            except Exception as e:
+                print("Word cache top-up failed:", e)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        self._executor.submit(run)
@@ -0,0 +1,247 @@
+# backend/word_templates.py
+"""
+Sinh bài toán lời văn tại chỗ từ thư viện mẫu (không cần OpenAI).
+
+Mỗi ngôn ngữ (vi/en, như i18n) có các mẫu theo phép tính và lớp tối thiểu;
+mẫu được ghép với tên người, đồ vật, vật chứa để tạo nhiều biến thể. Toán hạng
+được rút cả lô bằng generator.draw_operands (cùng ràng buộc với câu số học:
+trừ không âm, chia hết, bảng nhân/chia tới 12 ở lớp <= 3) với RNG riêng của
+request, nên mỗi câu chỉ tốn vài micro giây và có seed thì kết quả tất định.
+
+Cú pháp mẫu: {name}, {name2}, {item}/{items} (đồ vật số ít/số nhiều),
+{box}/{boxes} (vật chứa), {a}, {b}. Với {a}/{b} có thể thêm đơn vị:
+{a:item} -> "5 quả táo" / "5 apples", {a:box} -> "3 hộp" / "3 boxes",
+{a:page/pages} -> "1 page" / "2 pages" (số ít khi bằng 1).
+"""
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from schema import GenerationConfig
+from generator import OPS, draw_operands
+
+Pair = Tuple[str, str]
+_Part = Tuple[str, Optional[str], str]  # (chữ, trường, đơn vị)
+
+_WORD_STREAM = 0x776F7264  # tách luồng RNG của câu lời văn khỏi câu số học cùng seed
+
+# -----------------
+# Từ vựng
+# -----------------
+_NAMES = {
+    "vi": ("An", "Bình", "Chi", "Dũng", "Giang", "Hà", "Hoa", "Khoa", "Lan", "Linh",
+           "Mai", "Minh", "Nam", "Phúc", "Quân", "Tú", "Thảo", "Vy"),
+    "en": ("Anna", "Ben", "Chloe", "David", "Emma", "Finn", "Grace", "Hugo", "Isla", "Jack",
+           "Leo", "Lucy", "Mia", "Noah", "Omar", "Priya", "Sam", "Zoe"),
+}
+
+# (số ít, số nhiều); tiếng Việt không chia số nhiều nên hai dạng như nhau
+_ITEMS = {
+    "vi": tuple((w, w) for w in (
+        "quả táo", "quả cam", "cái bút chì", "viên bi", "quyển vở", "cái kẹo", "bông hoa",
+        "con tem", "chiếc bánh", "quả bóng", "cây bút màu", "cái nhãn dán", "vỏ sò", "quyển truyện",
+    )),
+    "en": (
+        ("apple", "apples"), ("orange", "oranges"), ("pencil", "pencils"), ("marble", "marbles"),
+        ("notebook", "notebooks"), ("candy", "candies"), ("flower", "flowers"), ("stamp", "stamps"),
+        ("cookie", "cookies"), ("ball", "balls"), ("crayon", "crayons"), ("sticker", "stickers"),
+        ("shell", "shells"), ("storybook", "storybooks"),
+    ),
+}
+
+_BOXES = {
+    "vi": tuple((w, w) for w in ("hộp", "túi", "giỏ", "khay", "rổ", "thùng", "ngăn", "bao")),
+    "en": (
+        ("box", "boxes"), ("bag", "bags"), ("basket", "baskets"), ("tray", "trays"),
+        ("jar", "jars"), ("crate", "crates"), ("drawer", "drawers"), ("packet", "packets"),
+    ),
+}
+
+# -----------------
+# Mẫu: (lớp tối thiểu, mẫu). Mỗi phép tính cần ít nhất một mẫu lớp 1.
+# Với ÷: a là số bị chia, b là số chia, đáp án là thương.
+# -----------------
+_TEMPLATES: Dict[str, Dict[str, Tuple[Tuple[int, str], ...]]] = {
+    "vi": {
+        "+": (
+            (1, "{name} có {a:item}, {name2} cho thêm {b:item}. Hỏi {name} có tất cả bao nhiêu {items}?"),
+            (1, "Trong rổ có {a:item}. Mẹ bỏ thêm vào {b:item}. Hỏi trong rổ có bao nhiêu {items}?"),
+            (1, "{name} có {a:item}, {name2} có {b:item}. Hỏi cả hai bạn có bao nhiêu {items}?"),
+            (1, "Buổi sáng cửa hàng bán được {a:item}, buổi chiều bán được {b:item}. Hỏi cả ngày cửa hàng bán được bao nhiêu {items}?"),
+            (2, "Thư viện có {a} quyển sách truyện và {b} quyển sách tham khảo. Hỏi thư viện có tất cả bao nhiêu quyển sách?"),
+            (2, "Đoạn đường thứ nhất dài {a} m, đoạn đường thứ hai dài {b} m. Hỏi cả hai đoạn đường dài bao nhiêu mét?"),
+            (3, "{name} đọc được {a} trang sách, {name2} đọc nhiều hơn {name} {b} trang. Hỏi {name2} đọc được bao nhiêu trang sách?"),
+            (3, "Tuần đầu lớp em quyên góp được {a} nghìn đồng, tuần sau quyên góp được {b} nghìn đồng. Hỏi cả hai tuần lớp em quyên góp được bao nhiêu nghìn đồng?"),
+            (3, "Một bể đang chứa {a} lít nước, người ta đổ thêm {b} lít. Hỏi bể chứa tất cả bao nhiêu lít nước?"),
+        ),
+        "-": (
+            (1, "{name} có {a:item}, {name} cho {name2} {b:item}. Hỏi {name} còn lại bao nhiêu {items}?"),
+            (1, "Trên cành có {a} con chim, {b} con bay đi. Hỏi trên cành còn lại bao nhiêu con chim?"),
+            (1, "Cửa hàng có {a:item}, đã bán {b:item}. Hỏi cửa hàng còn lại bao nhiêu {items}?"),
+            (1, "{name} có {a:item}, {name2} có {b:item}. Hỏi {name} có nhiều hơn {name2} bao nhiêu {items}?"),
+            (2, "Sợi dây dài {a} cm, {name} cắt đi {b} cm. Hỏi sợi dây còn lại dài bao nhiêu xăng-ti-mét?"),
+            (2, "Quyển truyện có {a} trang, {name} đã đọc {b} trang. Hỏi {name} còn phải đọc bao nhiêu trang nữa?"),
+            (3, "{name} có {a} nghìn đồng, {name} mua một quyển sách hết {b} nghìn đồng. Hỏi {name} còn lại bao nhiêu nghìn đồng?"),
+            (3, "Một bể chứa {a} lít nước, người ta đã dùng {b} lít. Hỏi bể còn lại bao nhiêu lít nước?"),
+            (3, "Trường có {a} học sinh, trong đó có {b} học sinh nữ. Hỏi trường có bao nhiêu học sinh nam?"),
+        ),
+        "×": (
+            (1, "Mỗi {box} có {a:item}. Hỏi {b:box} như thế có tất cả bao nhiêu {items}?"),
+            (1, "Mỗi bạn được chia {a:item}. Hỏi {b} bạn được chia tất cả bao nhiêu {items}?"),
+            (2, "{name} xếp {items} vào {b:box}, mỗi {box} có {a:item}. Hỏi {name} đã xếp được bao nhiêu {items}?"),
+            (2, "Mỗi ngày {name} đọc {a} trang sách. Hỏi trong {b} ngày {name} đọc được bao nhiêu trang sách?"),
+            (3, "Mỗi xe chở {a} bao gạo. Hỏi {b} xe như thế chở được bao nhiêu bao gạo?"),
+            (3, "Mỗi hàng có {a} học sinh, lớp xếp thành {b} hàng. Hỏi lớp có bao nhiêu học sinh?"),
+            (3, "Một chiếc bút giá {a} nghìn đồng. Hỏi mua {b} chiếc bút như thế hết bao nhiêu nghìn đồng?"),
+            (3, "Mỗi can chứa {a} lít nước. Hỏi {b} can như thế chứa tất cả bao nhiêu lít nước?"),
+        ),
+        "÷": (
+            (1, "Có {a:item} chia đều vào {b:box}. Hỏi mỗi {box} có bao nhiêu {items}?"),
+            (1, "{name} có {a:item}, chia đều cho {b} bạn. Hỏi mỗi bạn được bao nhiêu {items}?"),
+            (2, "Có {a:item}, xếp vào các {box}, mỗi {box} có {b:item}. Hỏi xếp được bao nhiêu {box}?"),
+            (2, "Sợi dây dài {a} m được cắt thành {b} đoạn bằng nhau. Hỏi mỗi đoạn dài bao nhiêu mét?"),
+            (2, "Lớp có {a} học sinh xếp đều thành {b} hàng. Hỏi mỗi hàng có bao nhiêu học sinh?"),
+            (3, "Mua {b} quyển vở như nhau hết {a} nghìn đồng. Hỏi mỗi quyển vở giá bao nhiêu nghìn đồng?"),
+            (3, "Có {a} lít nước rót đều vào {b} can. Hỏi mỗi can có bao nhiêu lít nước?"),
+            (3, "{name} đi bộ {a} m trong {b} phút, mỗi phút đi được quãng đường như nhau. Hỏi mỗi phút {name} đi được bao nhiêu mét?"),
+        ),
+    },
+    "en": {
+        "+": (
+            (1, "{name} has {a:item}. {name2} gives {name} {b:item} more. How many {items} does {name} have now?"),
+            (1, "A basket holds {a:item}. Mum puts in {b:item} more. How many {items} are in the basket now?"),
+            (1, "{name} has {a:item} and {name2} has {b:item}. How many {items} do they have altogether?"),
+            (1, "A shop sold {a:item} in the morning and {b:item} in the afternoon. How many {items} did it sell that day?"),
+            (2, "The library has {a:storybook/storybooks} and {b:dictionary/dictionaries}. How many books does it have in total?"),
+            (2, "The first path is {a:metre/metres} long and the second is {b:metre/metres} long. How long are the two paths together?"),
+            (3, "{name} read {a:page/pages}. {name2} read {b:page/pages} more than {name}. How many pages did {name2} read?"),
+            (3, "A class raised ${a} in the first week and ${b} in the second week. How much did the class raise in the two weeks?"),
+            (3, "A tank holds {a:litre/litres} of water. {name} pours in {b:litre/litres} more. How many litres are in the tank now?"),
+        ),
+        "-": (
+            (1, "{name} has {a:item} and gives {b:item} to {name2}. How many {items} does {name} have left?"),
+            (1, "There were {a:bird/birds} on a branch. Then {b:bird/birds} flew away. How many birds are left on the branch?"),
+            (1, "A shop had {a:item} and sold {b:item}. How many {items} are left?"),
+            (1, "{name} has {a:item} and {name2} has {b:item}. How many more {items} does {name} have than {name2}?"),
+            (2, "A rope is {a:centimetre/centimetres} long. {name} cuts off {b:centimetre/centimetres}. How long is the rope now?"),
+            (2, "A book has {a:page/pages}. {name} has read {b:page/pages}. How many pages are left to read?"),
+            (3, "{name} has ${a} and spends ${b} on a book. How much money does {name} have left?"),
+            (3, "A tank held {a:litre/litres} of water. {name} used {b:litre/litres}. How many litres are left?"),
+            (3, "A school has {a:pupil/pupils}. The number of girls is {b}. How many boys are there?"),
+        ),
+        "×": (
+            (1, "Each {box} holds {a:item}. How many {items} are in {b:box}?"),
+            (1, "Each child gets {a:item}. How many {items} are given to {b:child/children} altogether?"),
+            (2, "{name} packs {items} into {b:box}, putting {a:item} in each {box}. How many {items} did {name} pack?"),
+            (2, "{name} reads {a:page/pages} every day. How many pages does {name} read in {b:day/days}?"),
+            (3, "Each truck carries {a:sack/sacks} of rice. How many sacks are carried by {b:truck/trucks}?"),
+            (3, "A class stands in {b:row/rows} with {a:pupil/pupils} in each row. How many pupils are in the class?"),
+            (3, "A pen costs ${a}. What is the total cost of {b:pen/pens}?"),
+            (3, "Each can holds {a:litre/litres} of water. How many litres are there in {b:can/cans}?"),
+        ),
+        "÷": (
+            (1, "{name} puts {a:item} equally into {b:box}. How many {items} are in each {box}?"),
+            (1, "{name} shares {a:item} equally among {b:friend/friends}. How many {items} does each friend get?"),
+            (2, "{name} packs {a:item}, {b} to a {box}. How many {boxes} does {name} fill?"),
+            (2, "A rope {a:metre/metres} long is cut into {b:piece/pieces} of equal length. How long is each piece?"),
+            (2, "A class of {a:pupil/pupils} stands in {b:row/rows} of equal size. How many pupils are in each row?"),
+            (3, "{name} pays ${a} for {b:notebook/notebooks} of the same price. How much does one notebook cost?"),
+            (3, "{name} pours {a:litre/litres} of water equally into {b:can/cans}. How many litres are in each can?"),
+            (3, "{name} walks {a:metre/metres} in {b:minute/minutes} at a steady pace. How many metres does {name} walk each minute?"),
+        ),
+    },
+}
+
+_FIELDS = {"name", "name2", "item", "items", "box", "boxes", "a", "b"}
+
+
+def _compile(template: str) -> Tuple[_Part, ...]:
+    parts = []
+    for literal, field, spec, _ in Formatter().parse(template):
+        if field is not None and field not in _FIELDS:
+            raise ValueError(f"Unknown field {{{field}}} in template: {template}")
+        if spec and (field not in ("a", "b") or (spec not in ("item", "box") and "/" not in spec)):
+            raise ValueError(f"Bad unit {{{field}:{spec}}} in template: {template}")
+        parts.append((literal, field, spec or ""))
+    return tuple(parts)
+
+
+# Mẫu đã biên dịch theo (ngôn ngữ, phép tính): danh sách (lớp tối thiểu, các phần)
+_COMPILED: Dict[Tuple[str, str], List[Tuple[int, Tuple[_Part, ...]]]] = {
+    (lang, op): [(grade, _compile(t)) for grade, t in items]
+    for lang, by_op in _TEMPLATES.items()
+    for op, items in by_op.items()
+}
+
+
+def template_count(language: str, grade: int) -> int:
+    """Số mẫu dùng được cho một ngôn ngữ và lớp (tất cả phép tính)."""
+    return sum(
+        1 for (lang, _), items in _COMPILED.items() if lang == language
+        for g, _ in items if g <= grade
+    )
+
+
+def word_rng(seed: Optional[int], stream: int = 0) -> np.random.Generator:
+    """
+    RNG của request cho câu lời văn: cùng seed vẫn độc lập với luồng câu số học.
+    `stream` > 0 cho thêm luồng riêng (vd. phần bù theo lô của /api/generate/stream).
+    """
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([seed, _WORD_STREAM] + ([stream] if stream else []))
+
+
+def _counted(n: int, forms: Tuple[str, str]) -> str:
+    return f"{n} {forms[0] if n == 1 else forms[1]}"
+
+
+def render_word_problems(
+    cfg: GenerationConfig, n: int, rng: Optional[np.random.Generator] = None
+) -> List[Pair]:
+    """n cặp (đề, đáp án) theo ngôn ngữ, lớp, phép tính và phạm vi của cfg."""
+    if n <= 0:
+        return []
+    if rng is None:
+        rng = word_rng(cfg.seed)
+    lang = cfg.language if cfg.language in _TEMPLATES else "vi"
+    names, items, boxes = _NAMES[lang], _ITEMS[lang], _BOXES[lang]
+    eligible = {
+        op: [parts for g, parts in _COMPILED[(lang, op)] if g <= cfg.grade] for op in OPS
+    }
+
+    op_idx, a, b, ans = draw_operands(rng, cfg, n)
+    pick = rng.random(n).tolist()
+    name_i = rng.integers(0, len(names), size=n)
+    name_j = (name_i + rng.integers(1, len(names), size=n)) % len(names)  # luôn khác name
+    item_i = rng.integers(0, len(items), size=n).tolist()
+    box_i = rng.integers(0, len(boxes), size=n).tolist()
+
+    out: List[Pair] = []
+    for k, x, y, z, u, ni, nj, ii, bi in zip(
+        op_idx.tolist(), a.tolist(), b.tolist(), ans.tolist(), pick,
+        name_i.tolist(), name_j.tolist(), item_i, box_i,
+    ):
+        templates = eligible[OPS[k]]
+        item, box = items[ii], boxes[bi]
+        values = {
+            "name": names[ni], "name2": names[nj], "a": x, "b": y,
+            "item": item[0], "items": item[1], "box": box[0], "boxes": box[1],
+        }
+        chunks = []
+        for literal, field, spec in templates[int(u * len(templates))]:
+            chunks.append(literal)
+            if field is None:
+                continue
+            v = values[field]
+            if not spec:
+                chunks.append(str(v))
+            elif spec == "item":
+                chunks.append(_counted(v, item))
+            elif spec == "box":
+                chunks.append(_counted(v, box))
+            else:
+                chunks.append(_counted(v, tuple(spec.split("/", 1))))
+        out.append(("".join(chunks), str(z)))
+    return out